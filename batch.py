@@ -0,0 +1,225 @@
+from array import array
+import argparse
+import base64
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from rule_loaders.compiled import CompiledRulesLoader, rule_set_digest
+from wfc import basic
+from wfc.mapfile import write_map_file
+from wfc.ruleset import RuleSet, optimise_rule_set
+
+
+@dataclass(frozen=True)
+class Job:
+    seed: int
+    width: int
+    height: int
+    max_attempts: int
+    backtracking: basic.BacktrackingPolicy | None
+    output_dir: Path
+    collect_stats: bool = False
+    decisions_only: bool = False
+    binary: bool = False
+
+
+@dataclass(frozen=True)
+class JobResult:
+    seed: int
+    attempts: int
+    contradictions: int
+    valid: bool
+    output_path: Path
+    seconds: float
+
+
+_rule_set: RuleSet | None = None
+"""The compiled rules for the jobs run by this process, loaded once by `_load_rules` when the worker process starts."""
+
+_rules_optimised = False
+"""Whether `_rule_set` was passed through `optimise_rule_set`, which renumbers its deployments."""
+
+
+def _load_rules(rules_file: Path, cache_dir: Path | None = None, optimise: bool = False) -> None:
+    global _rule_set, _rules_optimised
+    _rule_set = CompiledRulesLoader(rules_file, cache_dir).load()
+    _rules_optimised = optimise
+
+    if optimise:
+        _rule_set, _ = optimise_rule_set(_rule_set)
+
+
+def _attempt_seed(seed: int, attempt: int) -> int | str:
+    """The first attempt uses the job seed itself (as `main.py` does), and each retry derives a new seed from it."""
+
+    return seed if attempt == 0 else f"{seed}/{attempt}"
+
+
+def _positive_int(value: str) -> int:
+    """An `argparse` type for counts and sizes, which must be at least one."""
+
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+
+    return number
+
+
+def grid_to_json_data(grid: basic.Grid) -> list[list[list[basic.TileID | int] | None]]:
+    """Convert a grid into rows of [tile ID, rotation] pairs, with `None` for cells that have not collapsed."""
+
+    return [[[cell.tile.id, int(cell.tile.rotation)] if cell.tile is not None else None for cell in row] for row in grid.get_grid()]
+
+
+def replay_map(rule_set: RuleSet, map_data: dict) -> basic.Grid:
+    """
+    Rebuild a map written with `--decisions-only` from its decision log, without solving it again.
+
+    The log holds deployment indices, so it must be replayed against the same rules it was written with
+    (optimised, if the map was generated with `--optimise-rules`).
+    """
+
+    if "rules_digest" in map_data and map_data["rules_digest"] != rule_set_digest(rule_set):
+        optimised = "optimised" if map_data.get("optimised_rules") else "unoptimised"
+        raise RuntimeError(f"This map was generated with different rules; it needs the same {optimised} rule set it was written with")
+
+    grid = basic.Grid((map_data["height"], map_data["width"]), rule_set)
+    # Maps written before decision logs were encoded hold a plain list of (cell index, entry) pairs
+    decisions = map_data["decisions"]
+    decision_log = array("i", decisions) if isinstance(decisions, list) else basic.decode_decision_log(base64.b64decode(decisions))
+
+    grid.replay_decision_log(decision_log)
+
+    return grid
+
+
+def generate_map(job: Job) -> JobResult:
+    """Collapse one map, retrying with a new seed whenever a contradiction is left in the grid, and write it to disk."""
+
+    assert _rule_set is not None
+
+    start = time.perf_counter()
+    contradictions = 0
+
+    # Shared by every attempt, so that the work thrown away on contradictions is counted too
+    stats = basic.GridStats() if job.collect_stats else None
+
+    for attempt in range(job.max_attempts):
+        rng = random.Random(_attempt_seed(job.seed, attempt))
+        grid = basic.Grid((job.height, job.width), _rule_set, backtracking=job.backtracking, stats=stats, rng=rng)
+        grid.collapse()
+
+        if grid.is_valid():
+            break
+
+        contradictions += 1
+
+    map_data = {"seed": job.seed, "attempts": attempt + 1, "valid": grid.is_valid()}
+
+    if job.decisions_only:
+        map_data.update(
+            width=job.width,
+            height=job.height,
+            optimised_rules=_rules_optimised,
+            rules_digest=rule_set_digest(_rule_set),
+            decisions=base64.b64encode(basic.encode_decision_log(grid.get_decision_log())).decode(),
+        )
+    elif job.binary:
+        tiles_path = job.output_dir / f"map_{job.seed}.wfcm"
+        write_map_file(tiles_path, grid)
+        map_data["tiles_file"] = tiles_path.name
+    else:
+        map_data["tiles"] = grid_to_json_data(grid)
+
+    if stats is not None:
+        map_data["stats"] = asdict(stats)
+
+    output_path = job.output_dir / f"map_{job.seed}.json"
+    with output_path.open("w") as output_file:
+        json.dump(map_data, output_file)
+
+    return JobResult(job.seed, attempt + 1, contradictions, grid.is_valid(), output_path, time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate many maps from a rules file without a GUI, in parallel.")
+    parser.add_argument("-r", "--rules", required=True)
+    parser.add_argument("-o", "--output-dir", required=True)
+    parser.add_argument("-n", "--count", type=_positive_int, default=1, help="Number of maps to generate (ignored when --seeds is given)")
+    parser.add_argument("--seeds", type=int, nargs="+", help="Explicit seed for each map")
+    parser.add_argument(
+        "--first-seed", type=int, default=1, help="Seed of the first map when --seeds is not given; later maps count up from it"
+    )
+    parser.add_argument("--width", type=_positive_int, default=32)
+    parser.add_argument("--height", type=_positive_int, default=32)
+    parser.add_argument("--max-attempts", type=_positive_int, default=3, help="Attempts per map before giving up on contradictions")
+    parser.add_argument("--backtrack-depth", type=int, default=0, help="Decisions to remember for backtracking (0 disables backtracking)")
+    parser.add_argument("--rules-cache-dir", help="Where compiled rule sets are cached (defaults to ~/.cache/wfc/rules)")
+    parser.add_argument(
+        "--optimise-rules", action="store_true", help="Merge identical rotations and remove tiles that can never have neighbours"
+    )
+    parser.add_argument("--stats", action="store_true", help="Count and time the solver's work, and include it in each map file")
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument(
+        "--binary", action="store_true", help="Store each map's tiles in a compact binary file (see wfc.mapfile) rather than JSON"
+    )
+    output_format.add_argument(
+        "--decisions-only", action="store_true", help="Store each map as its decision log rather than its tiles (see replay_map)"
+    )
+    parser.add_argument("-j", "--jobs", type=_positive_int, default=os.cpu_count(), help="Number of worker processes")
+
+    args = parser.parse_args()
+
+    seeds: list[int] = args.seeds if args.seeds is not None else list(range(args.first_seed, args.first_seed + args.count))
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    backtracking = basic.BacktrackingPolicy(max_depth=args.backtrack_depth) if args.backtrack_depth > 0 else None
+    jobs = [
+        Job(seed, args.width, args.height, args.max_attempts, backtracking, output_dir, args.stats, args.decisions_only, args.binary)
+        for seed in seeds
+    ]
+
+    rules_cache_dir = Path(args.rules_cache_dir) if args.rules_cache_dir else None
+
+    if args.optimise_rules:
+        _, report = optimise_rule_set(CompiledRulesLoader(Path(args.rules), rules_cache_dir).load())
+        print(
+            f"Optimised rules from {report.deployments_before} to {report.deployments_after} deployments "
+            f"({report.merged} merged, {report.pruned} pruned)"
+        )
+
+    start = time.perf_counter()
+    attempts, contradictions, failures = (0, 0, 0)
+
+    initargs = (Path(args.rules), rules_cache_dir, args.optimise_rules)
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_load_rules, initargs=initargs) as executor:
+        futures = [executor.submit(generate_map, job) for job in jobs]
+
+        for completed, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+
+            attempts += result.attempts
+            contradictions += result.contradictions
+            failures += not result.valid
+
+            status = "ok" if result.valid else "FAILED"
+            print(
+                f"[{completed}/{len(jobs)}] seed {result.seed}: {status} after {result.attempts} attempt(s), "
+                f"{result.seconds:.2f}s -> {result.output_path}"
+            )
+
+    elapsed = time.perf_counter() - start
+
+    print(f"Generated {len(jobs)} maps in {elapsed:.2f}s ({len(jobs) / elapsed:.2f} maps/s) using {args.jobs} worker(s)")
+    contradiction_rate = contradictions / attempts if attempts > 0 else 0.0
+    print(f"Contradiction rate: {contradictions}/{attempts} attempts ({contradiction_rate:.1%}), {failures} map(s) still invalid")
+
+
+if __name__ == "__main__":
+    main()
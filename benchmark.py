@@ -0,0 +1,201 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from rule_loaders.yaml import YamlRulesLoader
+from wfc import basic
+from wfc.basic_socket import BasicSocket, SocketType
+from wfc.ruleset import RuleSet, compile_rule_set
+from wfc.tile import TileDefinition
+from helpers.direction import PlanarDirections
+from helpers.rotation import AllRotations, Rotation
+
+EXAMPLE_RULES = {
+    "abstract": Path("examples/abstract/abstract.yaml"),
+    "grassy_roads": Path("examples/grassy_roads/grassy_roads.yaml"),
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    rules: str
+    size: int
+    seeds: int
+
+    collapse_seconds: float
+    """Median time to create and fully collapse a grid."""
+
+    select_seconds: float
+    """Mean time to find the next cell to collapse."""
+
+    step_seconds: float
+    """Mean time to collapse one cell and propagate the result."""
+
+    propagate_seconds: float
+    """Median time to propagate a single cell being constrained to one deployment, on a fresh grid."""
+
+    peak_memory_bytes: int
+    """Peak memory allocated while creating and collapsing a grid with the first seed."""
+
+    contradiction_rate: float
+    """The fraction of seeds that left the grid with a contradiction."""
+
+
+def synthetic_tile_definitions(tile_count: int, socket_count: int, seed: int) -> list[TileDefinition]:
+    """Build a random rule set, where every side of every tile has one or two of `socket_count` symmetric sockets."""
+
+    rng = random.Random(seed)
+    sockets = [BasicSocket(f"s{i}", SocketType.SYMMETRIC) for i in range(socket_count)]
+
+    return [
+        TileDefinition(
+            id=f"t{i}",
+            socket_sets={direction: set(rng.sample(sockets, rng.randint(1, min(2, socket_count)))) for direction in PlanarDirections},
+            prob_weight=rng.randint(1, 5),
+            allowed_rotations={rotation for rotation in AllRotations if rng.random() < 0.5} | {Rotation.NONE},
+        )
+        for i in range(tile_count)
+    ]
+
+
+def run_benchmark(name: str, rule_set: RuleSet, size: int, seeds: list[int], engine: basic.PropagationEngine) -> BenchmarkResult:
+    collapse_times, select_times, step_times, propagate_times = ([], [], [], [])
+    contradictions = 0
+
+    for seed in seeds:
+        random.seed(seed)
+        start = time.perf_counter()
+        grid = basic.Grid(size, rule_set, engine=engine)
+
+        while True:
+            select_start = time.perf_counter()
+            coordinate = grid.find_lowest_entropy_tile_superposition()
+            select_times.append(time.perf_counter() - select_start)
+
+            if coordinate is None:
+                break
+
+            step_start = time.perf_counter()
+            grid.collapse_tile_superposition(coordinate)
+            step_times.append(time.perf_counter() - step_start)
+
+        collapse_times.append(time.perf_counter() - start)
+        contradictions += not grid.is_valid()
+
+        random.seed(seed)
+        grid = basic.Grid(size, rule_set, engine=engine)
+        deployment = random.choice(rule_set.deployments)
+
+        propagate_start = time.perf_counter()
+        grid.constrain_tile_superposition((size // 2, size // 2), [deployment])
+        propagate_times.append(time.perf_counter() - propagate_start)
+
+    # Measured separately, since tracing allocations slows everything else down
+    random.seed(seeds[0])
+    tracemalloc.start()
+    basic.Grid(size, rule_set, engine=engine).collapse()
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return BenchmarkResult(
+        rules=name,
+        size=size,
+        seeds=len(seeds),
+        collapse_seconds=statistics.median(collapse_times),
+        select_seconds=statistics.fmean(select_times),
+        step_seconds=statistics.fmean(step_times) if step_times else 0.0,
+        propagate_seconds=statistics.median(propagate_times),
+        peak_memory_bytes=peak_memory_bytes,
+        contradiction_rate=contradictions / len(seeds),
+    )
+
+
+def _current_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_comparison(baseline: dict, results: list[BenchmarkResult]) -> None:
+    """Print how long each benchmark took relative to the same benchmark in a baseline results file."""
+
+    baseline_results = {(result["rules"], result["size"]): result for result in baseline["results"]}
+
+    print(f"Compared with {baseline.get('commit') or 'baseline'} (ratios below 1.00 are faster):")
+
+    for result in results:
+        old = baseline_results.get((result.rules, result.size))
+        if old is None:
+            continue
+
+        ratios = [
+            f"{field} {getattr(result, field) / old[field]:.2f}x" if old[field] else f"{field} n/a"
+            for field in ("collapse_seconds", "step_seconds", "propagate_seconds", "peak_memory_bytes")
+        ]
+        print(f"  {result.rules:>16} {result.size:>4}: {', '.join(ratios)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time the solver on the example rules and on synthetic rules, and write the results as JSON."
+    )
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="A results file from an earlier run to compare against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--synthetic", nargs="*", default=["20x4", "60x8"], help="Synthetic rule sets, as TILESxSOCKETS")
+    parser.add_argument("--no-examples", action="store_true", help="Skip the example rule sets")
+    parser.add_argument(
+        "--engine", choices=[engine.name for engine in basic.PropagationEngine], default=basic.PropagationEngine.WORKLIST.name
+    )
+
+    args = parser.parse_args()
+
+    rule_sets: dict[str, RuleSet] = {}
+
+    if not args.no_examples:
+        for name, path in EXAMPLE_RULES.items():
+            rule_sets[name] = compile_rule_set(YamlRulesLoader(path).load())
+
+    for spec in args.synthetic:
+        tile_count, socket_count = (int(part) for part in spec.split("x"))
+        rule_sets[f"synthetic_{spec}"] = compile_rule_set(synthetic_tile_definitions(tile_count, socket_count, seed=0))
+
+    engine = basic.PropagationEngine[args.engine]
+    results: list[BenchmarkResult] = []
+
+    for name, rule_set in rule_sets.items():
+        for size in args.sizes:
+            result = run_benchmark(name, rule_set, size, args.seeds, engine)
+            results.append(result)
+
+            print(
+                f"{name:>16} {size:>4}: collapse {result.collapse_seconds * 1000:9.2f}ms, step {result.step_seconds * 1e6:8.1f}us, "
+                f"select {result.select_seconds * 1e6:6.1f}us, propagate {result.propagate_seconds * 1000:7.2f}ms, "
+                f"peak {result.peak_memory_bytes / 2**20:7.2f}MiB, contradictions {result.contradiction_rate:.0%}"
+            )
+
+    report = {
+        "commit": _current_commit(),
+        "python": platform.python_version(),
+        "engine": engine.name,
+        "seeds": args.seeds,
+        "results": [asdict(result) for result in results],
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.compare:
+        _print_comparison(json.loads(Path(args.compare).read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
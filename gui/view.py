@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Iterable
 import pygame
 from pathlib import Path
 from enum import Enum
@@ -19,6 +19,7 @@ class UserAction(Enum):
     COLLAPSE_ALL_SLOWLY = 3
     COLLAPSE_ALL_IMMEDIATELY = 4
     COLLAPSE_SPECIFIC = 5
+    CANCEL_COLLAPSE = 6
 
 
 class GUI:
@@ -30,38 +31,69 @@ class GUI:
         self._max_fps = 60
         self._clock = pygame.time.Clock()
 
-    def display_grid(self, grid_data: list[list[TileAsset]]) -> None:
-        """Displays the grid data and waits for the user to press a button."""
+        # The number of (rows, columns) in the grid currently on screen
+        self._grid_dimensions: tuple[int, int] = (0, 0)
+
+        # Each image is loaded once, and each (asset, cell size) is rotated and scaled once
+        self._images: dict[Path, pygame.Surface] = {}
+        self._surfaces: dict[tuple[TileAsset, tuple[int, int]], pygame.Surface] = {}
 
-        black = (0, 0, 0)
-        self._screen.fill(black)
+    def display_grid(self, grid_data: list[list[TileAsset]]) -> None:
+        """Draws every cell of the grid data."""
 
         rows = len(grid_data)
         columns = len(grid_data[0])
 
-        cell_height = self._screen_height / rows
-        cell_width = self._screen_width / columns
+        self.display_cells(rows, columns, (((row, column), grid_data[row][column]) for row in range(rows) for column in range(columns)))
+
+    def display_cells(self, rows: int, columns: int, cells: Iterable[tuple[tuple[int, int], TileAsset]]) -> None:
+        """
+        Draws only the given ((row, column), asset) cells of a grid with the given number of rows and columns,
+        and updates only those parts of the screen.
+        """
+
+        if (rows, columns) != self._grid_dimensions:
+            self._grid_dimensions = (rows, columns)
+
+            black = (0, 0, 0)
+            self._screen.fill(black)
+            pygame.display.flip()
 
-        all_tile_assets: set[TileAsset] = set()
-        for g in grid_data:
-            for gg in g:
-                all_tile_assets.add(gg)
+        dirty_rects: list[pygame.Rect] = []
 
-        loaded_tile_assets: dict[TileAsset, pygame.Surface] = {
-            asset: pygame.image.load(asset.image_path) for asset in all_tile_assets
-        }
+        for (row, column), asset in cells:
+            rect = self._get_cell_rect(row, column)
+            self._screen.blit(self._get_surface(asset, rect.size), rect)
+            dirty_rects.append(rect)
 
-        for row in range(rows):
-            for column in range(columns):
-                asset = grid_data[row][column]
-                image = loaded_tile_assets[asset]
-                image = pygame.transform.rotate(image, asset.rotation)
-                image = pygame.transform.scale(image, (cell_width, cell_height))
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
 
-                rect = pygame.Rect(column * cell_width, row * cell_height, cell_width, cell_height)
-                self._screen.blit(image, rect)
+    def _get_cell_rect(self, row: int, column: int) -> pygame.Rect:
+        rows, columns = self._grid_dimensions
 
-        pygame.display.flip()
+        # Cell edges are rounded down to whole pixels, so that neighbouring cells always meet exactly
+        left, right = ((column * self._screen_width) // columns, ((column + 1) * self._screen_width) // columns)
+        top, bottom = ((row * self._screen_height) // rows, ((row + 1) * self._screen_height) // rows)
+
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def _get_surface(self, asset: TileAsset, size: tuple[int, int]) -> pygame.Surface:
+        """Returns the asset's image, rotated and scaled to the given size. Images are only loaded, rotated and scaled once."""
+
+        surface = self._surfaces.get((asset, size))
+
+        if surface is None:
+            image = self._images.get(asset.image_path)
+
+            if image is None:
+                image = pygame.image.load(asset.image_path).convert_alpha()
+                self._images[asset.image_path] = image
+
+            surface = pygame.transform.scale(pygame.transform.rotate(image, asset.rotation), size)
+            self._surfaces[(asset, size)] = surface
+
+        return surface
 
     def handle_events(self) -> list[tuple[UserAction, Any]]:
         """
@@ -90,6 +122,9 @@ class GUI:
                 if event.key == pygame.K_RETURN:
                     events.append((UserAction.COLLAPSE_ALL_IMMEDIATELY, None))
 
+                if event.key == pygame.K_ESCAPE:
+                    events.append((UserAction.CANCEL_COLLAPSE, None))
+
             if event.type == pygame.MOUSEBUTTONUP:
                 (width, height) = pygame.mouse.get_pos()
                 events.append((UserAction.COLLAPSE_SPECIFIC, (width, height)))
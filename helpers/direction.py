@@ -7,12 +7,22 @@ class Direction(Enum):
     DOWN = 2
     RIGHT = 3
 
+    # Between the layers of a 3D grid
+    ABOVE = 4
+    BELOW = 5
+
+
+PlanarDirections = [Direction.LEFT, Direction.UP, Direction.DOWN, Direction.RIGHT]
+"""The directions within a single layer, which are the only directions in a 2D grid."""
+
 
 opposite_direction = {
     Direction.LEFT: Direction.RIGHT,
     Direction.UP: Direction.DOWN,
     Direction.DOWN: Direction.UP,
     Direction.RIGHT: Direction.LEFT,
+    Direction.ABOVE: Direction.BELOW,
+    Direction.BELOW: Direction.ABOVE,
 }
 
 
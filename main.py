@@ -2,42 +2,54 @@ import argparse
 import random
 from graphics_loaders.yaml import YamlGraphicsLoader
 from gui.view import GUI, UserAction, TileAsset
-from wfc import basic
+from wfc import basic, vectorized
+from wfc.background import BackgroundSolver
 from pathlib import Path
 from rule_loaders.yaml import YamlRulesLoader
 
 
-def grid_data_to_display_data(
-    grid: basic.Grid, tile_graphics: dict[basic.TileID, Path], superposition_graphic: TileAsset, invalid_graphic: TileAsset
-) -> list[list[TileAsset]]:
-    grid_size = grid.get_grid_size()
+def tile_superposition_to_display_data(
+    tile_superposition: basic.TileSuperposition,
+    tile_graphics: dict[basic.TileID, Path],
+    superposition_graphic: TileAsset,
+    invalid_graphic: TileAsset,
+) -> TileAsset:
+    if tile_superposition.superposition == basic.Superposition.INVALID:
+        return invalid_graphic
 
-    grid_data: list[list[TileAsset]] = [[TileAsset(Path()) for _ in range(grid_size)] for _ in range(grid_size)]
+    elif tile_superposition.superposition == basic.Superposition.COLLAPSED:
+        assert tile_superposition.tile is not None
 
-    for row_idx, row in enumerate(grid.get_grid()):
-        for col_idx, tile_superposition in enumerate(row):
-            if tile_superposition.superposition == basic.Superposition.INVALID:
-                grid_data[row_idx][col_idx] = invalid_graphic
+        asset_path = tile_graphics[tile_superposition.tile.id]
+        return TileAsset(asset_path, rotation=tile_superposition.tile.rotation)
 
-            elif tile_superposition.superposition == basic.Superposition.COLLAPSED:
-                assert tile_superposition.tile is not None
+    elif tile_superposition.superposition == basic.Superposition.SUPERPOSITION:
+        return superposition_graphic
 
-                asset_path = tile_graphics[tile_superposition.tile.id]
-                grid_data[row_idx][col_idx] = TileAsset(asset_path, rotation=tile_superposition.tile.rotation)
+    else:
+        raise RuntimeError(f"Unknown tile superposition: {tile_superposition.superposition}")
 
-            elif tile_superposition.superposition == basic.Superposition.SUPERPOSITION:
-                grid_data[row_idx][col_idx] = superposition_graphic
 
-            else:
-                raise RuntimeError(f"Unknown tile superposition: {tile_superposition.superposition}")
+def grid_changes_to_display_data(
+    solver: BackgroundSolver, tile_graphics: dict[basic.TileID, Path], superposition_graphic: TileAsset, invalid_graphic: TileAsset
+) -> list[tuple[basic.Coordinate, TileAsset]]:
+    """Return the display data for only the cells that have changed since the grid was last asked."""
 
-    return grid_data
+    return [
+        (coordinate, tile_superposition_to_display_data(tile_superposition, tile_graphics, superposition_graphic, invalid_graphic))
+        for coordinate, tile_superposition in solver.get_changes()
+    ]
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", "--rules", required=True)
     parser.add_argument("-g", "--graphics")
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Use the experimental NumPy grid, which is only faster for rules with hundreds of deployments",
+    )
 
     args = parser.parse_args()
 
@@ -52,7 +64,11 @@ def main() -> None:
     tile_definitions = YamlRulesLoader(Path(args.rules)).load()
 
     grid_size = 32
-    grid = basic.Grid(grid_size, tile_definitions)
+    grid: basic.Grid | vectorized.Grid
+    if args.vectorized:
+        grid = vectorized.Grid(grid_size, tile_definitions)
+    else:
+        grid = basic.Grid(grid_size, tile_definitions)
 
     tile_graphics = YamlGraphicsLoader(Path(args.graphics)).load()
 
@@ -62,6 +78,9 @@ def main() -> None:
     (screen_width, screen_height) = (800, 800)
     gui = GUI(screen_width, screen_height)
 
+    # Collapsing the whole grid happens in the background, so that the window keeps responding
+    solver = BackgroundSolver(grid)
+
     collapse_slowly = False
 
     while True:
@@ -69,10 +88,18 @@ def main() -> None:
 
         for event, event_data in events:
             if event == UserAction.QUIT:
+                solver.cancel()
                 return
 
+            elif event == UserAction.CANCEL_COLLAPSE:
+                solver.cancel()
+
+            elif solver.is_running():
+                # The grid belongs to the solver until it finishes or is cancelled
+                continue
+
             elif event == UserAction.COLLAPSE_ALL_IMMEDIATELY:
-                grid.collapse()
+                solver.start()
 
             elif event == UserAction.COLLAPSE_ONE:
                 tile_coordinate = grid.find_lowest_entropy_tile_superposition()
@@ -91,13 +118,14 @@ def main() -> None:
 
                 grid.collapse_tile_superposition((row, column))
 
-        if collapse_slowly:
+        if collapse_slowly and not solver.is_running():
             tile_coordinate = grid.find_lowest_entropy_tile_superposition()
             if tile_coordinate is not None:
                 grid.collapse_tile_superposition(tile_coordinate)
 
-        display_data = grid_data_to_display_data(grid, tile_graphics, superposition_graphic, invalid_graphic)
-        gui.display_grid(display_data)
+        # The first changes from the grid cover every cell, and after that only cells that changed are redrawn
+        changed_display_data = grid_changes_to_display_data(solver, tile_graphics, superposition_graphic, invalid_graphic)
+        gui.display_cells(grid_size, grid_size, changed_display_data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any
+from rule_loaders.yaml import YamlRulesLoader
+from wfc.ruleset import RuleSet, TileDeployment, compile_rule_set
+from helpers.direction import Direction
+from helpers.rotation import Rotation
+
+_compiled_format_version = 1
+"""Part of every cache key, so that changing how rules are compiled or stored never loads a stale artifact."""
+
+
+def default_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "wfc" / "rules"
+
+
+class CompiledRulesLoader:
+    """
+    Loads a YAML rules file as an already compiled `RuleSet`.
+
+    Compiled rule sets are cached on disk, keyed by a hash of the YAML file's contents, so that the YAML is only parsed
+    and compiled the first time a particular version of the file is loaded.
+    """
+
+    def __init__(self, yaml_file: Path, cache_dir: Path | None = None) -> None:
+        self._yaml_file = yaml_file
+        self._cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+
+    def load(self) -> RuleSet:
+        digest = hashlib.sha256(self._yaml_file.read_bytes()).hexdigest()
+        cache_file = self._cache_dir / f"{digest}.v{_compiled_format_version}.json"
+
+        try:
+            with cache_file.open() as file:
+                return _rule_set_from_data(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, unreadable or corrupt: compile it again and replace it
+            pass
+
+        rule_set = compile_rule_set(YamlRulesLoader(self._yaml_file).load())
+
+        try:
+            self._write(cache_file, _rule_set_to_data(rule_set))
+        except OSError:
+            # The cache only saves time, so a read-only or missing cache directory is not an error
+            pass
+
+        return rule_set
+
+    def _write(self, cache_file: Path, data: dict[str, Any]) -> None:
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Written to a temporary file and then renamed into place, so that a worker never reads a half-written file
+        handle, temporary_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+
+        try:
+            with os.fdopen(handle, "w") as file:
+                json.dump(data, file)
+
+            os.replace(temporary_path, cache_file)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+
+def rule_set_digest(rule_set: RuleSet) -> str:
+    """Return a hash of a compiled rule set, which changes whenever its deployments, weights or adjacency change."""
+
+    return hashlib.sha256(json.dumps(_rule_set_to_data(rule_set), sort_keys=True).encode()).hexdigest()
+
+
+def _rule_set_to_data(rule_set: RuleSet) -> dict[str, Any]:
+    return {
+        "tile_ids": rule_set.tile_ids,
+        "deployments": [[deployment.id, int(deployment.rotation)] for deployment in rule_set.deployments],
+        "deployment_tiles": rule_set.deployment_tiles,
+        "deployment_weights": rule_set.deployment_weights,
+        "adjacency": {direction.name: masks for direction, masks in rule_set.adjacency.items()},
+    }
+
+
+def _rule_set_from_data(data: dict[str, Any]) -> RuleSet:
+    return RuleSet(
+        tile_ids=data["tile_ids"],
+        deployments=[TileDeployment(id, Rotation(rotation)) for (id, rotation) in data["deployments"]],
+        deployment_tiles=data["deployment_tiles"],
+        deployment_weights=data["deployment_weights"],
+        adjacency={Direction[name]: masks for name, masks in data["adjacency"].items()},
+    )
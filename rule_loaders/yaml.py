@@ -7,11 +7,16 @@ from helpers.rotation import Rotation
 from helpers.direction import Direction
 
 
+# The C loader (when PyYAML was built with libyaml) parses the same documents many times faster
+_Loader = getattr(yaml, "CLoader", yaml.Loader)
+
+
 class YamlRulesLoader:
     _supported_file_versions = [1]
 
     def __init__(self, yaml_file: Path) -> None:
-        self._data = yaml.load(yaml_file.open(), Loader=yaml.Loader)
+        with yaml_file.open() as file:
+            self._data = yaml.load(file, Loader=_Loader)
 
         match self._data:
             case {"version": version}:
@@ -91,18 +96,39 @@ class YamlRulesLoader:
     @staticmethod
     def _load_tile_socket_sets(socket_sets: Any, socket_defs: dict[SocketID, BasicSocket]) -> DirectionalSocketSetMap:
         match socket_sets:
-            case {"left": [*left_data], "right": [*right_data], "up": [*up_data], "down": [*down_data]}:
+            case {"left": [*left_data], "right": [*right_data], "up": [*up_data], "down": [*down_data], **vertical_data}:
 
-                return {
+                planar_socket_sets = {
                     Direction.UP: {socket_defs[s] for s in up_data},
                     Direction.LEFT: {socket_defs[s] for s in left_data},
                     Direction.RIGHT: {socket_defs[s] for s in right_data},
                     Direction.DOWN: {socket_defs[s] for s in down_data},
                 }
 
+                return planar_socket_sets | YamlRulesLoader._load_vertical_socket_sets(vertical_data, socket_defs)
+
             case _:
                 raise RuntimeError(f"Failed to parse socket set definitions: {repr(socket_sets)}")
 
+    @staticmethod
+    def _load_vertical_socket_sets(vertical_data: dict[str, Any], socket_defs: dict[SocketID, BasicSocket]) -> DirectionalSocketSetMap:
+        """Tiles for 3D grids also have sockets above and below them."""
+
+        match vertical_data:
+            case _ if not vertical_data:
+                return {}
+
+            case {"above": [*above_data], "below": [*below_data], **rest} if not rest:
+                return {
+                    Direction.ABOVE: {socket_defs[s] for s in above_data},
+                    Direction.BELOW: {socket_defs[s] for s in below_data},
+                }
+
+            case _:
+                raise RuntimeError(
+                    f"Failed to parse vertical socket set definitions (both above and below are needed): {repr(vertical_data)}"
+                )
+
     def _load_socket_data(self) -> dict[SocketID, BasicSocket]:
         match self._data:
             case {"sockets": [*sockets]}:
@@ -0,0 +1,48 @@
+import random
+from pathlib import Path
+from wfc.background import *
+from rule_loaders.yaml import YamlRulesLoader
+
+EXAMPLE_RULES = Path("examples/grassy_roads/grassy_roads.yaml")
+
+
+def test_background_solve_matches_inline_collapse():
+    tile_definitions = YamlRulesLoader(EXAMPLE_RULES).load()
+
+    random.seed(8)
+    inline_grid = basic.Grid(16, tile_definitions)
+    inline_grid.collapse()
+
+    random.seed(8)
+    grid = basic.Grid(16, tile_definitions)
+    solver = BackgroundSolver(grid)
+
+    replayed: dict[Coordinate, TileSuperposition] = {}
+
+    solver.start()
+    while solver.is_running():
+        replayed.update(solver.get_changes())
+
+    solver.wait()
+    replayed.update(solver.get_changes())
+
+    assert grid.get_grid() == inline_grid.get_grid()
+    assert [[replayed[(row, column)] for column in range(16)] for row in range(16)] == inline_grid.get_grid()
+
+
+def test_background_solve_can_be_cancelled():
+    random.seed(1)
+    grid = basic.Grid(64, YamlRulesLoader(EXAMPLE_RULES).load())
+    solver = BackgroundSolver(grid)
+
+    solver.start()
+    solver.cancel()
+
+    assert not solver.is_running()
+    assert not grid.has_collapsed()
+
+    # A cancelled solve can be picked up again where it stopped
+    solver.start()
+    solver.wait()
+
+    assert grid.has_collapsed()
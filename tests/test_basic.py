@@ -0,0 +1,551 @@
+from array import array
+import itertools
+import json
+import math
+import random
+import tracemalloc
+import pytest
+from pathlib import Path
+from wfc.basic import *
+from wfc.basic import _has_collapsed, _iterate_indices
+from rule_loaders.yaml import YamlRulesLoader
+from wfc.basic_socket import BasicSocket, SocketType
+from helpers.rotation import AllRotations, Rotation
+
+EXAMPLE_RULES = [
+    Path("examples/abstract/abstract.yaml"),
+    Path("examples/grassy_roads/grassy_roads.yaml"),
+]
+
+
+def test_possibility_set_helpers():
+    assert not _has_collapsed(0)
+    assert _has_collapsed(0b1000)
+    assert not _has_collapsed(0b1010)
+
+    assert list(_iterate_indices(0)) == []
+    assert list(_iterate_indices(0b101001)) == [0, 3, 5]
+
+
+def test_grid_cells_share_initial_possibility_set():
+    grid = Grid(8, YamlRulesLoader(EXAMPLE_RULES[0]).load())
+
+    assert len(grid._wave) == 64
+    assert all(possibilities is grid._wave[0] for possibilities in grid._wave)
+    assert grid._wave[0].bit_count() == len(grid._deployments)
+
+
+def test_lowest_entropy_matches_full_scan():
+    random.seed(3)
+    grid = Grid(10, YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    while (coordinate := grid.find_lowest_entropy_tile_superposition()) is not None:
+        uncollapsed = [p.bit_count() for p in grid._wave if p != 0 and not _has_collapsed(p)]
+        assert grid._get_possibilities(coordinate).bit_count() == min(uncollapsed)
+
+        grid.collapse_tile_superposition(coordinate)
+
+    assert grid.has_collapsed()
+
+
+def _collapsed_grid(
+    grid_size: int, tile_definitions: list[TileDefinition], engine: PropagationEngine, seed: int
+) -> list[list[TileSuperposition]]:
+    random.seed(seed)
+    grid = Grid(grid_size, tile_definitions, engine=engine)
+    grid.collapse()
+
+    return grid.get_grid()
+
+
+def test_support_count_engine_matches_worklist_engine():
+    for rules in EXAMPLE_RULES:
+        for seed in range(3):
+            tile_definitions = YamlRulesLoader(rules).load()
+
+            worklist = _collapsed_grid(12, tile_definitions, PropagationEngine.WORKLIST, seed)
+            support_count = _collapsed_grid(12, tile_definitions, PropagationEngine.SUPPORT_COUNT, seed)
+
+            assert worklist == support_count
+
+
+def test_support_count_engine_removes_deployments_without_partners():
+    grass = BasicSocket("grass", SocketType.SYMMETRIC)
+    water = BasicSocket("water", SocketType.SYMMETRIC)
+
+    tile_definitions = [
+        TileDefinition("grass", {direction: {grass} for direction in Direction}),
+        TileDefinition("shore", {Direction.LEFT: {grass}, Direction.UP: {grass}, Direction.DOWN: {grass}, Direction.RIGHT: {water}}),
+    ]
+
+    for seed in range(3):
+        worklist = _collapsed_grid(6, tile_definitions, PropagationEngine.WORKLIST, seed)
+        support_count = _collapsed_grid(6, tile_definitions, PropagationEngine.SUPPORT_COUNT, seed)
+
+        assert worklist == support_count
+
+
+def test_weighted_shannon_entropy_sums_stay_exact():
+    random.seed(5)
+    grid = Grid(10, YamlRulesLoader(EXAMPLE_RULES[1]).load(), entropy_heuristic=EntropyHeuristic.WEIGHTED_SHANNON)
+
+    for _ in range(20):
+        coordinate = grid.find_lowest_entropy_tile_superposition()
+        assert coordinate is not None
+        grid.collapse_tile_superposition(coordinate)
+
+    weights = grid._rule_set.deployment_weights
+    entropies: list[float] = []
+
+    for cell_idx, possibilities in enumerate(grid._wave):
+        remaining = [weights[i] for i in _iterate_indices(possibilities)]
+
+        assert math.isclose(grid._weight_sums[cell_idx], sum(remaining))
+        assert math.isclose(grid._weight_log_weight_sums[cell_idx], sum(w * math.log(w) for w in remaining), abs_tol=1e-9)
+
+        if len(remaining) > 1:
+            entropies.append(math.log(sum(remaining)) - sum(w * math.log(w) for w in remaining) / sum(remaining))
+
+    coordinate = grid.find_lowest_entropy_tile_superposition()
+    assert coordinate is not None
+    assert math.isclose(grid._get_entropy(coordinate[0] * 10 + coordinate[1]), min(entropies))
+
+
+def test_choose_deployment_follows_deployment_weights():
+    random.seed(11)
+    grid = Grid(2, YamlRulesLoader(EXAMPLE_RULES[1]).load())
+    weights = grid._rule_set.deployment_weights
+
+    possibilities = 0b101011
+    counts = {i: 0 for i in _iterate_indices(possibilities)}
+    draws = 20000
+
+    for _ in range(draws):
+        counts[grid._choose_deployment(possibilities)] += 1
+
+    total_weight = sum(weights[i] for i in counts)
+    for index, count in counts.items():
+        assert abs(count / draws - weights[index] / total_weight) < 0.02
+
+
+def _contradiction_prone_tile_definitions() -> list[TileDefinition]:
+    """A rule set where most unassisted 12x12 collapses end in a contradiction."""
+
+    s = [BasicSocket(i, SocketType.SYMMETRIC) for i in range(4)]
+    left, up, down, right = (Direction.LEFT, Direction.UP, Direction.DOWN, Direction.RIGHT)
+
+    return [
+        TileDefinition(
+            0, {left: {s[1], s[2]}, up: {s[1]}, down: {s[2]}, right: {s[0], s[1]}}, prob_weight=5, allowed_rotations={Rotation.CLOCKWISE}
+        ),
+        TileDefinition(
+            1, {left: {s[0], s[3]}, up: {s[1]}, down: {s[0]}, right: {s[0]}}, prob_weight=4, allowed_rotations={Rotation.CLOCKWISE}
+        ),
+        TileDefinition(
+            2,
+            {left: {s[3]}, up: {s[2]}, down: {s[3]}, right: {s[0], s[2]}},
+            prob_weight=2,
+            allowed_rotations={Rotation.ANTICLOCKWISE, Rotation.HALF},
+        ),
+        TileDefinition(3, {left: {s[0], s[1]}, up: {s[3]}, down: {s[0]}, right: {s[1]}}, prob_weight=2, allowed_rotations={Rotation.HALF}),
+    ]
+
+
+def test_backtracking_recovers_from_contradictions():
+    policy = BacktrackingPolicy(max_depth=16, max_restarts=5)
+    contradictions_without_backtracking = 0
+
+    for engine in PropagationEngine:
+        for seed in range(5):
+            random.seed(seed)
+            grid = Grid(12, _contradiction_prone_tile_definitions(), engine=engine)
+            grid.collapse()
+            contradictions_without_backtracking += not grid.is_valid()
+
+            random.seed(seed)
+            grid = Grid(12, _contradiction_prone_tile_definitions(), engine=engine, backtracking=policy)
+            grid.collapse()
+
+            assert grid.is_valid()
+            assert grid.has_collapsed()
+
+    assert contradictions_without_backtracking > 0
+
+
+def test_support_count_engine_matches_worklist_engine_on_contradictions():
+    contradictions = 0
+
+    for heuristic in EntropyHeuristic:
+        for seed in range(8):
+            grids: list[Grid] = []
+
+            for engine in PropagationEngine:
+                grid = Grid(
+                    (9, 13), _contradiction_prone_tile_definitions(), engine=engine, entropy_heuristic=heuristic, rng=random.Random(seed)
+                )
+                grid.collapse()
+                grids.append(grid)
+
+            worklist, support_count = grids
+
+            assert worklist.pretty_print_grid_state() == support_count.pretty_print_grid_state()
+            assert list(worklist.get_decision_log()) == list(support_count.get_decision_log())
+            contradictions += not worklist.is_valid()
+
+    assert contradictions > 0
+
+
+def test_undo_restores_support_counts():
+    random.seed(2)
+    grid = Grid(
+        8, _contradiction_prone_tile_definitions(), engine=PropagationEngine.SUPPORT_COUNT, backtracking=BacktrackingPolicy(max_depth=64)
+    )
+    initial_counts = grid._support_counts.tolist()
+
+    for coordinate in [(0, 0), (4, 4), (7, 2)]:
+        grid.collapse_tile_superposition(coordinate)
+
+    while len(grid._decisions) > 0:
+        grid._undo(grid._decisions.pop().trail)
+
+    assert all(possibilities == grid._all_possibilities for possibilities in grid._wave)
+    assert grid._support_counts.tolist() == initial_counts
+
+
+def _assert_support_counts_match_wave(grid: Grid) -> None:
+    """Recount, from the wave, how many deployments of each neighbour support each deployment that each cell still has."""
+
+    tile_count = len(grid._deployments)
+    directions = grid._topology.directions
+
+    for cell_idx in range(len(grid._wave)):
+        for position, (table, _, _) in enumerate(grid._neighbours):
+            neighbour_idx = table[cell_idx]
+            if neighbour_idx < 0:
+                continue
+
+            # The neighbour's deployments which allow each deployment of this cell on their opposite side
+            adjacency = grid._adjacency[opposite_direction[directions[position]]]
+            offset = (cell_idx * len(directions) + position) * tile_count
+
+            for index in _iterate_indices(grid._wave[cell_idx]):
+                expected = sum((adjacency[i] >> index) & 1 for i in _iterate_indices(grid._wave[neighbour_idx]))
+                assert grid._support_counts[offset + index] == expected
+
+
+def test_backtracking_never_undoes_constraints():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    for engine in PropagationEngine:
+        grid = Grid(4, rule_set, engine=engine, backtracking=BacktrackingPolicy(), rng=random.Random(1))
+        grid.collapse_tile_superposition((0, 0))
+
+        # A deployment that cannot sit to the right of the collapsed cell, so constraining to it undoes that collapse
+        collapsed_index = rule_set.deployments.index(grid.get_grid()[0][0].tile)
+        incompatible = next(
+            d for i, d in enumerate(rule_set.deployments) if not (rule_set.adjacency[Direction.RIGHT][collapsed_index] >> i) & 1
+        )
+
+        grid.constrain_tile_superposition((0, 1), [incompatible])
+
+        assert grid.is_valid()
+        assert grid.get_grid()[0][1].tile == incompatible
+
+        grid.collapse()
+
+        assert grid.is_valid()
+        assert grid.get_grid()[0][1].tile == incompatible
+
+
+def test_backtracking_only_reapplies_constraints_on_cells_it_reset():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    grid = Grid(16, rule_set, backtracking=BacktrackingPolicy(), rng=random.Random(1))
+    grid.constrain_tile_superpositions({(15, column): rule_set.deployments for column in range(16)})
+    grid.collapse_tile_superposition((0, 0))
+
+    reapplied: list[dict[int, PossibilitySet]] = []
+    constrain = grid._constrain
+
+    def recording_constrain(allowed_by_cell: dict[int, PossibilitySet]) -> None:
+        reapplied.append(allowed_by_cell)
+        constrain(allowed_by_cell)
+
+    grid._constrain = recording_constrain
+
+    collapsed_index = rule_set.deployments.index(grid.get_grid()[0][0].tile)
+    incompatible = next(
+        d for i, d in enumerate(rule_set.deployments) if not (rule_set.adjacency[Direction.RIGHT][collapsed_index] >> i) & 1
+    )
+
+    grid.constrain_tile_superposition((0, 1), [incompatible])
+
+    # The collapse was undone, and the constraints along the bottom row (which it never reached) were left alone
+    assert grid.is_valid()
+    assert len(reapplied) == 2
+    assert set(reapplied[1]) == {0, 1}
+
+
+def test_constraining_to_a_lost_deployment_keeps_support_counts_exact():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    grid = Grid(4, rule_set, engine=PropagationEngine.SUPPORT_COUNT, backtracking=BacktrackingPolicy(), rng=random.Random(1))
+    grid.collapse_tile_superposition((0, 0))
+
+    lost = next(d for i, d in enumerate(rule_set.deployments) if not (grid._wave[1] >> i) & 1)
+    grid.constrain_tile_superposition((0, 1), [lost])
+
+    _assert_support_counts_match_wave(grid)
+
+    grid.collapse()
+
+    assert grid.is_valid()
+    _assert_support_counts_match_wave(grid)
+
+
+def test_changes_replay_to_the_same_grid():
+    for backtracking in (None, BacktrackingPolicy(max_depth=16, max_restarts=2)):
+        random.seed(4)
+        grid = Grid(10, _contradiction_prone_tile_definitions(), backtracking=backtracking)
+
+        replayed: dict[Coordinate, TileSuperposition] = dict(grid.get_changes())
+        assert len(replayed) == 100
+
+        while (coordinate := grid.find_lowest_entropy_tile_superposition()) is not None:
+            grid.collapse_tile_superposition(coordinate)
+            changes = grid.get_changes()
+
+            assert coordinate in dict(changes)
+            replayed.update(changes)
+
+        assert grid.get_changes() == []
+        assert [[replayed[(row, column)] for column in range(10)] for row in range(10)] == grid.get_grid()
+
+
+def test_changes_are_only_tracked_once_asked_for():
+    grid = Grid(10, _contradiction_prone_tile_definitions(), rng=random.Random(4))
+
+    for _ in range(20):
+        grid.collapse_tile_superposition(grid.find_lowest_entropy_tile_superposition())
+
+    assert grid._changed_cells is None
+    assert len(grid.get_changes()) == 100
+
+    grid.collapse_tile_superposition(grid.find_lowest_entropy_tile_superposition())
+
+    assert 0 < len(grid.get_changes()) < 100
+
+
+def test_stats_and_observer_do_not_change_the_result():
+    class RecordingObserver(GridObserver):
+        def __init__(self) -> None:
+            self.collapses: list[tuple[Coordinate, TileDeployment]] = []
+            self.contradictions: list[Coordinate] = []
+
+        def on_collapse(self, coordinate: Coordinate, deployment: TileDeployment) -> None:
+            self.collapses.append((coordinate, deployment))
+
+        def on_contradiction(self, coordinate: Coordinate) -> None:
+            self.contradictions.append(coordinate)
+
+    for engine in PropagationEngine:
+        policy = BacktrackingPolicy(max_depth=16, max_restarts=5)
+
+        random.seed(2)
+        plain_grid = Grid(12, _contradiction_prone_tile_definitions(), engine=engine, backtracking=policy)
+        plain_grid.collapse()
+
+        stats, observer = (GridStats(), RecordingObserver())
+        random.seed(2)
+        grid = Grid(12, _contradiction_prone_tile_definitions(), engine=engine, backtracking=policy, stats=stats, observer=observer)
+        grid.collapse()
+
+        assert grid.get_grid() == plain_grid.get_grid()
+        assert stats.collapses == len(observer.collapses) > 0
+        assert stats.contradictions == len(observer.contradictions) > 0
+        assert stats.backtracks > 0
+        assert stats.selections > stats.collapses
+        assert stats.propagations >= stats.collapses
+        assert stats.max_worklist_length > 0
+        assert stats.select_seconds > 0 and stats.propagate_seconds > 0
+        assert json.loads(stats.to_json())["collapses"] == stats.collapses
+
+
+def test_grids_with_their_own_rng_do_not_affect_each_other():
+    rules = YamlRulesLoader(EXAMPLE_RULES[1]).load()
+
+    separate = []
+    for seed in (1, 2):
+        grid = Grid(12, rules, rng=random.Random(seed))
+        grid.collapse()
+        separate.append(grid.get_grid())
+
+    # Interleave two grids, and draw from the module's generator in between
+    grids = [Grid(12, rules, rng=random.Random(seed)) for seed in (1, 2)]
+    while any(not grid.has_collapsed() for grid in grids):
+        for grid in grids:
+            random.random()
+            if (coordinate := grid.find_lowest_entropy_tile_superposition()) is not None:
+                grid.collapse_tile_superposition(coordinate)
+
+    assert [grid.get_grid() for grid in grids] == separate
+
+
+def test_decision_log_replays_to_the_same_grid():
+    for engine in PropagationEngine:
+        for seed in range(4):
+            grid = Grid(
+                12,
+                _contradiction_prone_tile_definitions(),
+                engine=engine,
+                backtracking=BacktrackingPolicy(max_depth=16, max_restarts=5),
+                rng=random.Random(seed),
+            )
+            grid.constrain_tile_superposition((5, 5), [TileDeployment(2, Rotation.HALF)])
+            grid.collapse()
+            decision_log = grid.get_decision_log()
+
+            replayed = Grid(12, _contradiction_prone_tile_definitions(), engine=engine)
+            replayed.constrain_tile_superposition((5, 5), [TileDeployment(2, Rotation.HALF)])
+            replayed.replay_decision_log(decision_log)
+
+            assert replayed.get_grid() == grid.get_grid()
+            assert replayed.get_decision_log() == decision_log
+            assert replayed.find_lowest_entropy_tile_superposition() is None
+
+
+def test_replaying_a_decision_log_draws_no_random_numbers():
+    class NoRandom(random.Random):
+        def random(self) -> float:
+            raise AssertionError("A replay must not draw random numbers")
+
+    rules = YamlRulesLoader(EXAMPLE_RULES[1]).load()
+
+    grid = Grid(16, rules, rng=random.Random(3))
+    grid.collapse()
+
+    replayed = Grid(16, rules, rng=NoRandom())
+    replayed.replay_decision_log(grid.get_decision_log())
+
+    assert replayed.get_grid() == grid.get_grid()
+
+
+def test_encoded_decision_log_replays_to_the_same_grid():
+    rules = _contradiction_prone_tile_definitions()
+
+    grid = Grid(16, rules, backtracking=BacktrackingPolicy(max_depth=16, max_restarts=5), rng=random.Random(2))
+    grid.collapse()
+    decision_log = grid.get_decision_log()
+    assert any(entry < 0 for entry in decision_log[1::2])
+
+    encoded = encode_decision_log(decision_log)
+    decoded = decode_decision_log(encoded)
+
+    assert len(encoded) < len(decision_log)
+    assert sorted(zip(decoded[0::2], decoded[1::2])) == sorted(zip(decision_log[0::2], decision_log[1::2]))
+
+    replayed = Grid(16, rules)
+    replayed.replay_decision_log(decoded)
+
+    assert replayed.get_grid() == grid.get_grid()
+    assert decode_decision_log(encode_decision_log(array("i"))) == array("i")
+
+
+def test_cells_take_under_100_bytes_and_grow_little_during_a_solve():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+    cell_count = 48 * 48
+
+    for engine in PropagationEngine:
+        # The neighbour tables are shared by every grid of the same shape, so are built before measuring
+        Grid(48, rule_set, engine=engine)
+
+        tracemalloc.start()
+        grid = Grid(48, rule_set, engine=engine, rng=random.Random(0))
+
+        # A grid draws its tie-breakers when it first chooses a cell
+        coordinate = grid.find_lowest_entropy_tile_superposition()
+        fresh_bytes, _ = tracemalloc.get_traced_memory()
+        grid.collapse_tile_superposition(coordinate)
+
+        # Measure again once a third of the grid has collapsed, when the entropy heap is at its busiest
+        while sum(map(_has_collapsed, grid._wave)) * 3 < cell_count:
+            for _ in range(16):
+                grid.collapse_tile_superposition(grid.find_lowest_entropy_tile_superposition())
+
+        solving_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert fresh_bytes / cell_count < 100
+        assert (solving_bytes - fresh_bytes) / cell_count < 20
+
+
+def test_bulk_constraints_match_one_at_a_time_with_one_propagation():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    for engine in PropagationEngine:
+        source = Grid(24, rule_set, engine=engine, rng=random.Random(5))
+        source.collapse()
+        tiles = source.get_grid()
+
+        # Stamp the border and one row through the middle
+        stamp = {
+            (row, column): [tiles[row][column].tile] for row in range(24) for column in range(24) if row in (0, 12, 23) or column in (0, 23)
+        }
+
+        one_at_a_time = Grid(24, rule_set, engine=engine)
+        for coordinate, allowed in stamp.items():
+            one_at_a_time.constrain_tile_superposition(coordinate, allowed)
+
+        stats = GridStats()
+        bulk = Grid(24, rule_set, engine=engine, stats=stats)
+        bulk.constrain_tile_superpositions(stamp)
+
+        assert bulk.get_grid() == one_at_a_time.get_grid()
+        assert stats.propagations == 1
+        assert all(bulk.get_grid()[row][column].tile == tiles[row][column].tile for (row, column) in stamp)
+
+
+def test_voxel_grid_respects_vertical_sockets():
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/voxels/voxels.yaml")).load())
+    offsets = {Direction.RIGHT: (0, 0, 1), Direction.DOWN: (0, 1, 0), Direction.ABOVE: (1, 0, 0)}
+
+    for engine in PropagationEngine:
+        grid = Grid(
+            (4, 10, 12), rule_set, engine=engine, backtracking=BacktrackingPolicy(max_depth=16, max_restarts=3), rng=random.Random(2)
+        )
+        grid.collapse()
+
+        assert grid.is_valid() and grid.has_collapsed()
+        assert grid.get_dimensions() == (4, 10, 12)
+
+        cells = grid.get_grid()
+        index_of = {deployment: index for index, deployment in enumerate(rule_set.deployments)}
+
+        for layer, row, column in itertools.product(range(4), range(10), range(12)):
+            for direction, (layer_step, row_step, column_step) in offsets.items():
+                if layer + layer_step < 4 and row + row_step < 10 and column + column_step < 12:
+                    tile = index_of[cells[layer][row][column].tile]
+                    neighbour = index_of[cells[layer + layer_step][row + row_step][column + column_step].tile]
+
+                    assert (rule_set.adjacency[direction][tile] >> neighbour) & 1
+
+
+def test_periodic_grid_wraps_around():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES[1]).load())
+
+    grid = Grid((8, 10), rule_set, backtracking=BacktrackingPolicy(max_depth=16, max_restarts=3), rng=random.Random(1), periodic=True)
+    grid.collapse()
+    assert grid.is_valid()
+
+    cells = grid.get_grid()
+    index_of = {deployment: index for index, deployment in enumerate(rule_set.deployments)}
+
+    for row in range(8):
+        assert (rule_set.adjacency[Direction.RIGHT][index_of[cells[row][9].tile]] >> index_of[cells[row][0].tile]) & 1
+    for column in range(10):
+        assert (rule_set.adjacency[Direction.DOWN][index_of[cells[7][column].tile]] >> index_of[cells[0][column].tile]) & 1
+
+
+def test_3d_grid_needs_vertical_sockets():
+    with pytest.raises(RuntimeError):
+        Grid((2, 4, 4), YamlRulesLoader(EXAMPLE_RULES[0]).load())
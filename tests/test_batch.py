@@ -0,0 +1,103 @@
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from batch import Job, _load_rules, generate_map, grid_to_json_data, replay_map
+from rule_loaders.compiled import CompiledRulesLoader
+from rule_loaders.yaml import YamlRulesLoader
+from wfc import basic
+from wfc.ruleset import optimise_rule_set
+
+RULES = Path("examples/grassy_roads/grassy_roads.yaml")
+
+
+def test_batch_does_not_import_pygame():
+    subprocess.run([sys.executable, "-c", "import batch, sys; assert 'pygame' not in sys.modules"], check=True)
+
+
+def test_generate_map_is_reproducible_from_its_seed(tmp_path: Path):
+    _load_rules(RULES, tmp_path / "cache")
+    result = generate_map(Job(seed=42, width=9, height=5, max_attempts=1, backtracking=None, output_dir=tmp_path))
+
+    random.seed(42)
+    grid = basic.Grid((5, 9), YamlRulesLoader(RULES).load())
+    grid.collapse()
+
+    written = json.loads(result.output_path.read_text())
+
+    assert result.valid
+    assert written["seed"] == 42
+    assert written["tiles"] == grid_to_json_data(grid)
+
+
+# Every rotation of `grass` is the same, so optimising these rules merges them and renumbers the deployments
+ROTATED_RULES = """
+version: 1
+
+sockets:
+  - id: grass
+    type: symmetric
+  - id: road
+    type: symmetric
+
+tiles:
+  - id: grass
+    prob_weight: 4
+    allowed_rotations: [none, clockwise, half, anticlockwise]
+    sockets:
+      left: [grass]
+      up: [grass]
+      down: [grass]
+      right: [grass]
+
+  - id: road
+    allowed_rotations: [none, clockwise, half, anticlockwise]
+    sockets:
+      left: [road]
+      up: [grass]
+      down: [grass]
+      right: [road]
+"""
+
+
+def test_replaying_a_decision_log_needs_the_rules_it_was_written_with(tmp_path: Path):
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(ROTATED_RULES)
+
+    _load_rules(rules_file, tmp_path / "cache", optimise=True)
+    result = generate_map(Job(seed=3, width=8, height=6, max_attempts=1, backtracking=None, output_dir=tmp_path, decisions_only=True))
+    map_data = json.loads(result.output_path.read_text())
+
+    rule_set = CompiledRulesLoader(rules_file, tmp_path / "cache").load()
+    optimised_rule_set, _ = optimise_rule_set(rule_set)
+
+    assert map_data["optimised_rules"]
+    assert replay_map(optimised_rule_set, map_data).has_collapsed()
+
+    with pytest.raises(RuntimeError):
+        replay_map(rule_set, map_data)
+
+
+def test_batch_rejects_counts_and_sizes_below_one(tmp_path: Path):
+    for argument in (["-n", "0"], ["--max-attempts", "0"], ["--width", "0"], ["--height", "-1"], ["-j", "0"]):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "batch.py",
+                "-r",
+                str(RULES),
+                "-o",
+                str(tmp_path / "maps"),
+                "--rules-cache-dir",
+                str(tmp_path / "cache"),
+                *argument,
+            ],
+            capture_output=True,
+            text=True,
+        )
+
+        assert result.returncode == 2
+        assert "must be at least 1" in result.stderr
+        assert not (tmp_path / "maps").exists()
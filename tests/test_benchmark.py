@@ -0,0 +1,20 @@
+from benchmark import *
+
+
+def test_synthetic_tile_definitions_are_reproducible():
+    first = compile_rule_set(synthetic_tile_definitions(12, 3, seed=5))
+    second = compile_rule_set(synthetic_tile_definitions(12, 3, seed=5))
+
+    assert first == second
+    assert first.tile_ids == [f"t{i}" for i in range(12)]
+
+
+def test_run_benchmark_reports_every_measurement():
+    rule_set = compile_rule_set(YamlRulesLoader(EXAMPLE_RULES["grassy_roads"]).load())
+
+    result = run_benchmark("grassy_roads", rule_set, 6, [0, 1], basic.PropagationEngine.WORKLIST)
+
+    assert (result.rules, result.size, result.seeds) == ("grassy_roads", 6, 2)
+    assert result.collapse_seconds > 0 and result.step_seconds > 0 and result.propagate_seconds > 0
+    assert result.peak_memory_bytes > 0
+    assert result.contradiction_rate == 0
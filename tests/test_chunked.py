@@ -0,0 +1,86 @@
+import io
+import json
+from pathlib import Path
+from wfc.chunked import *
+from wfc.ruleset import compile_rule_set
+from rule_loaders.yaml import YamlRulesLoader
+
+
+class _MapSink(ChunkSink):
+    def __init__(self, dimensions: GridDimensions) -> None:
+        self.tiles: ChunkTiles = [[None] * dimensions[1] for _ in range(dimensions[0])]
+        self.origins: list[Coordinate] = []
+
+    def write_chunk(self, origin: Coordinate, tiles: ChunkTiles) -> None:
+        self.origins.append(origin)
+
+        for row_idx, row in enumerate(tiles):
+            self.tiles[origin[0] + row_idx][origin[1] : origin[1] + len(row)] = row
+
+
+def test_chunked_map_seams_are_compatible():
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load())
+    sink = _MapSink((30, 40))
+
+    failed_chunks = ChunkedMapGenerator(rule_set, (30, 40), (16, 16), seed=4).generate(sink)
+
+    assert failed_chunks == 0
+    assert sink.origins == [(0, 0), (0, 16), (0, 32), (16, 0), (16, 16), (16, 32)]
+
+    for row_idx, row in enumerate(sink.tiles):
+        for col_idx, tile in enumerate(row):
+            assert tile is not None
+
+            if row_idx > 0:
+                assert tile in compatible_deployments(rule_set, sink.tiles[row_idx - 1][col_idx], Direction.DOWN)
+
+            if col_idx > 0:
+                assert tile in compatible_deployments(rule_set, row[col_idx - 1], Direction.RIGHT)
+
+
+def test_chunked_map_is_deterministic():
+    tile_definitions = YamlRulesLoader(Path("examples/abstract/abstract.yaml")).load()
+    outputs: list[str] = []
+
+    for _ in range(2):
+        output = io.StringIO()
+        ChunkedMapGenerator(tile_definitions, (20, 20), (8, 8), seed=9).generate(JsonLinesChunkSink(output))
+        outputs.append(output.getvalue())
+
+    assert outputs[0] == outputs[1]
+    assert [json.loads(line)["row"] for line in outputs[0].splitlines()] == [0, 0, 0, 8, 8, 8, 16, 16, 16]
+
+
+def test_infinite_world_seams_are_compatible():
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load())
+    world = InfiniteWorld(rule_set, seed=3, chunk_dimensions=(6, 8))
+
+    area = [[world.get_tile((row, column)) for column in range(-10, 14)] for row in range(-7, 9)]
+
+    for row_idx, row in enumerate(area):
+        for col_idx, tile in enumerate(row):
+            assert tile is not None
+
+            if row_idx > 0:
+                assert tile in compatible_deployments(rule_set, area[row_idx - 1][col_idx], Direction.DOWN)
+
+            if col_idx > 0:
+                assert tile in compatible_deployments(rule_set, row[col_idx - 1], Direction.RIGHT)
+
+
+def test_infinite_world_evicted_chunks_regenerate_identically():
+    tile_definitions = YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load()
+
+    # Room for two 8x8 chunks of 4-byte indices
+    world = InfiniteWorld(tile_definitions, seed=12, chunk_dimensions=(8, 8), max_cache_bytes=2 * 8 * 8 * 4)
+    first = world.get_chunk((5, -2))
+
+    for chunk_column in range(3):
+        world.get_chunk((0, chunk_column))
+
+    assert world.get_cached_chunk_count() == 2
+    assert world.get_cache_bytes() <= 2 * 8 * 8 * 4
+    assert world.get_chunk((5, -2)) == first
+
+    # The same chunk, generated first in a world of its own
+    assert InfiniteWorld(tile_definitions, seed=12, chunk_dimensions=(8, 8)).get_chunk((5, -2)) == first
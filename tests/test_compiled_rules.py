@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+from rule_loaders.compiled import *
+from rule_loaders.yaml import YamlRulesLoader
+
+RULES = Path("examples/grassy_roads/grassy_roads.yaml")
+
+
+def test_compiled_rules_round_trip_through_the_cache(tmp_path: Path):
+    expected = compile_rule_set(YamlRulesLoader(RULES).load())
+
+    cold = CompiledRulesLoader(RULES, tmp_path).load()
+    cached_files = list(tmp_path.iterdir())
+    warm = CompiledRulesLoader(RULES, tmp_path).load()
+
+    assert len(cached_files) == 1
+    assert cold == expected
+    assert warm == expected
+
+
+def test_compiled_rules_are_keyed_by_file_contents(tmp_path: Path):
+    rules = tmp_path / "rules.yaml"
+    rules.write_text(RULES.read_text())
+    cache_dir = tmp_path / "cache"
+
+    CompiledRulesLoader(rules, cache_dir).load()
+
+    rules.write_text(RULES.read_text().replace("prob_weight: 25", "prob_weight: 26", 1))
+    changed = CompiledRulesLoader(rules, cache_dir).load()
+
+    assert len(list(cache_dir.iterdir())) == 2
+    assert changed.deployment_weights[0] == 26
+    assert changed == compile_rule_set(YamlRulesLoader(rules).load())
+
+
+def test_corrupt_cache_entries_are_recompiled(tmp_path: Path):
+    CompiledRulesLoader(RULES, tmp_path).load()
+
+    (cache_file,) = tmp_path.iterdir()
+    cache_file.write_text("{not json")
+
+    assert CompiledRulesLoader(RULES, tmp_path).load() == compile_rule_set(YamlRulesLoader(RULES).load())
+    assert json.loads(cache_file.read_text())["tile_ids"][0] == "grass1"
@@ -0,0 +1,54 @@
+import random
+from pathlib import Path
+from wfc import basic, vectorized
+from wfc.chunked import ChunkedMapGenerator
+from wfc.mapfile import *
+from wfc.ruleset import compile_rule_set
+from rule_loaders.yaml import YamlRulesLoader
+
+
+def _grid_tiles(grid: basic.Grid | vectorized.Grid) -> ChunkTiles:
+    return [[cell.tile for cell in row] for row in grid.get_grid()]
+
+
+def test_map_file_round_trips_a_grid(tmp_path: Path):
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load())
+
+    for grid_class in (basic.Grid, vectorized.Grid):
+        grid = grid_class((12, 20), rule_set, rng=random.Random(3))
+
+        # Leave part of the grid uncollapsed, which is stored as cells without tiles
+        for _ in range(40):
+            grid.collapse_tile_superposition(grid.find_lowest_entropy_tile_superposition())
+
+        write_map_file(tmp_path / "map.wfcm", grid)
+        tiles = _grid_tiles(grid)
+
+        with MapFile(tmp_path / "map.wfcm") as map_file:
+            assert map_file.get_dimensions() == (12, 20)
+            assert map_file.get_tile_ids() == rule_set.tile_ids
+            assert map_file.read_region((0, 0), (12, 20)) == tiles
+            assert map_file.read_region((3, 5), (4, 6)) == [row[5:11] for row in tiles[3:7]]
+            assert map_file.get_tile((11, 19)) == tiles[11][19]
+            assert any(tile is None for row in tiles for tile in row)
+
+
+def test_map_file_writer_is_a_chunk_sink(tmp_path: Path):
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load())
+
+    with MapFileWriter(tmp_path / "map.wfcm", (30, 40), rule_set.tile_ids) as writer:
+        ChunkedMapGenerator(rule_set, (30, 40), (16, 16), seed=4).generate(writer)
+
+    with MapFile(tmp_path / "map.wfcm") as map_file:
+        assert all(tile is not None for row in map_file.read_region((0, 0), (30, 40)) for tile in row)
+        assert map_file.get_cells().shape == (30, 40)
+
+
+def test_map_file_writer_starts_every_cell_without_a_tile(tmp_path: Path):
+    # A cell area of several fill slices, the last of them partial
+    with MapFileWriter(tmp_path / "map.wfcm", (700, 1000), ["a"]):
+        pass
+
+    with MapFile(tmp_path / "map.wfcm") as map_file:
+        assert (map_file.get_cells() == 0xFFFF).all()
+        assert map_file.get_tile((699, 999)) is None
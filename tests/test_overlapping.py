@@ -0,0 +1,90 @@
+import random
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from wfc import basic, vectorized
+from wfc.basic import BacktrackingPolicy
+from wfc.overlapping import *
+from helpers.direction import Direction
+
+
+def _sample(stray_pixel: bool = True) -> np.ndarray:
+    """A small RGB sample of brick-like rows, optionally with a stray pixel so that not every pattern is symmetric."""
+
+    sample = np.full((12, 12, 3), 200, dtype=np.uint8)
+    sample[::4, :] = (90, 30, 20)
+    sample[1::4, ::6] = (90, 30, 20)
+    sample[3::4, 3::6] = (90, 30, 20)
+    if stray_pixel:
+        sample[5, 7] = (10, 120, 10)
+
+    return sample
+
+
+def _windows(image: np.ndarray, n: int) -> set[bytes]:
+    return {window.tobytes() for window in sliding_window_view(image, (n, n), axis=(0, 1)).reshape(-1, image.shape[2], n, n)}
+
+
+def test_patterns_and_weights_match_every_window_of_the_sample():
+    sample = _sample()
+    model = extract_overlapping_model(sample, 3, rotations=True, reflections=True)
+
+    expected: dict[bytes, int] = {}
+    for window in sliding_window_view(sample, (3, 3), axis=(0, 1)).reshape(-1, 3, 3, 3):
+        pixels = np.moveaxis(window, 0, 2)
+        for k in range(4):
+            for variant in (np.rot90(pixels, k), np.rot90(pixels, k)[:, ::-1]):
+                key = np.ascontiguousarray(variant).tobytes()
+                expected[key] = expected.get(key, 0) + 1
+
+    actual = {
+        np.ascontiguousarray(model.colours[pattern]).tobytes(): weight
+        for pattern, weight in zip(model.patterns, model.rule_set.deployment_weights)
+    }
+
+    assert actual == expected
+
+
+def test_adjacency_matches_pattern_overlaps():
+    model = extract_overlapping_model(_sample(), 3, rotations=True)
+    patterns = model.patterns
+
+    for index, pattern in enumerate(patterns):
+        for other_index, other in enumerate(patterns):
+            expected = {
+                Direction.LEFT: np.array_equal(pattern[:, :-1], other[:, 1:]),
+                Direction.UP: np.array_equal(pattern[:-1, :], other[1:, :]),
+                Direction.DOWN: np.array_equal(pattern[1:, :], other[:-1, :]),
+                Direction.RIGHT: np.array_equal(pattern[:, 1:], other[:, :-1]),
+            }
+
+            for direction, allowed in expected.items():
+                assert bool((model.rule_set.adjacency[direction][index] >> other_index) & 1) == allowed
+
+
+def test_every_window_of_the_output_comes_from_the_sample():
+    sample = _sample(stray_pixel=False)
+    model = extract_overlapping_model(sample, 3, periodic_sample=True)
+
+    sample_windows = _windows(np.pad(sample, ((0, 2), (0, 2), (0, 0)), mode="wrap"), 3)
+
+    for grid in (
+        basic.Grid((16, 20), model.rule_set, rng=random.Random(2)),
+        vectorized.Grid((16, 20), model.rule_set, rng=random.Random(2)),
+    ):
+        grid.collapse()
+        image = model.to_image(grid)
+
+        assert grid.is_valid()
+        assert image.shape == (18, 22, 3)
+        assert _windows(image, 3) <= sample_windows
+
+    # A periodic output wraps around, so has a window at every cell, and must be a whole number of bricks across
+    grid = basic.Grid(
+        (16, 24), model.rule_set, backtracking=BacktrackingPolicy(max_depth=32, max_restarts=5), rng=random.Random(2), periodic=True
+    )
+    grid.collapse()
+    image = model.to_image(grid, periodic=True)
+
+    assert grid.is_valid()
+    assert image.shape == (16, 24, 3)
+    assert _windows(np.pad(image, ((0, 2), (0, 2), (0, 0)), mode="wrap"), 3) <= sample_windows
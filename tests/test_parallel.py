@@ -0,0 +1,38 @@
+from pathlib import Path
+from wfc.parallel import *
+from wfc.parallel import _partition
+from rule_loaders.yaml import YamlRulesLoader
+
+
+def test_partition_separates_regions_with_seams():
+    assert _partition(20, 6, 2) == ([(0, 6), (8, 14), (16, 20)], [(6, 8), (14, 16)])
+    assert _partition(14, 6, 2) == ([(0, 6), (8, 14)], [(6, 8)])
+    assert _partition(5, 6, 2) == ([(0, 5)], [])
+
+
+def test_parallel_solver_fills_seams_compatibly():
+    rule_set = compile_rule_set(YamlRulesLoader(Path("examples/grassy_roads/grassy_roads.yaml")).load())
+
+    tiles, failed_blocks = ParallelSolver(rule_set, (40, 50), seed=6, region_dimensions=(12, 12), workers=1).solve()
+
+    assert failed_blocks == 0
+
+    for row_idx, row in enumerate(tiles):
+        for col_idx, tile in enumerate(row):
+            assert tile is not None
+
+            if row_idx > 0:
+                assert tile in compatible_deployments(rule_set, tiles[row_idx - 1][col_idx], Direction.DOWN)
+
+            if col_idx > 0:
+                assert tile in compatible_deployments(rule_set, row[col_idx - 1], Direction.RIGHT)
+
+
+def test_parallel_solver_result_does_not_depend_on_worker_count():
+    tile_definitions = YamlRulesLoader(Path("examples/abstract/abstract.yaml")).load()
+
+    results = [
+        ParallelSolver(tile_definitions, (30, 30), seed=2, region_dimensions=(10, 10), workers=workers).solve() for workers in (1, 2)
+    ]
+
+    assert results[0] == results[1]
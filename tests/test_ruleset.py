@@ -0,0 +1,95 @@
+import random
+import pytest
+from pathlib import Path
+from wfc.basic import Grid
+from wfc.basic_socket import BasicSocket, SocketType
+from wfc.ruleset import *
+from wfc.tile import rotate_socket_sets
+from helpers.direction import PlanarDirections
+from helpers.rotation import AllRotations, Rotation
+from rule_loaders.yaml import YamlRulesLoader
+
+EXAMPLE_RULES = [
+    Path("examples/abstract/abstract.yaml"),
+    Path("examples/grassy_roads/grassy_roads.yaml"),
+]
+
+
+def test_deployments_cover_every_allowed_rotation():
+    for rules in EXAMPLE_RULES:
+        tile_definitions = YamlRulesLoader(rules).load()
+        rule_set = compile_rule_set(tile_definitions)
+
+        expected = [TileDeployment(d.id, rotation=r) for d in tile_definitions for r in d.allowed_rotations]
+
+        assert rule_set.deployments == expected
+        assert [rule_set.tile_ids[t] for t in rule_set.deployment_tiles] == [d.id for d in expected]
+
+
+def test_adjacency_table_matches_socket_compatibility():
+    for rules in EXAMPLE_RULES:
+        tile_definitions = YamlRulesLoader(rules).load()
+        rule_set = compile_rule_set(tile_definitions)
+
+        socket_sets = [rotate_socket_sets(d.socket_sets, r) for d in tile_definitions for r in d.allowed_rotations]
+
+        assert list(rule_set.adjacency) == PlanarDirections
+
+        for direction in PlanarDirections:
+            for index, tile_socket_sets in enumerate(socket_sets):
+                for other_index, other_socket_sets in enumerate(socket_sets):
+                    expected = socket_sets_are_compatible(other_socket_sets[opposite_direction[direction]], tile_socket_sets[direction])
+                    actual = bool((rule_set.adjacency[direction][index] >> other_index) & 1)
+
+                    assert actual == expected
+
+
+def test_tiles_without_a_positive_weight_are_rejected():
+    grass = BasicSocket("grass", SocketType.SYMMETRIC)
+
+    for weight in (0, -1, float("nan")):
+        tile_definitions = [
+            TileDefinition("grass", {direction: {grass} for direction in Direction}),
+            TileDefinition("flowers", {direction: {grass} for direction in Direction}, prob_weight=weight),
+        ]
+
+        with pytest.raises(RuntimeError):
+            compile_rule_set(tile_definitions)
+
+
+def test_optimiser_merges_symmetric_rotations_and_prunes_dead_tiles():
+    grass = BasicSocket("grass", SocketType.SYMMETRIC)
+    road = BasicSocket("road", SocketType.SYMMETRIC)
+    water = BasicSocket("water", SocketType.SYMMETRIC)
+
+    tile_definitions = [
+        TileDefinition("grass", {direction: {grass} for direction in Direction}, prob_weight=8, allowed_rotations=set(AllRotations)),
+        TileDefinition(
+            "road",
+            {Direction.LEFT: {road}, Direction.UP: {grass}, Direction.DOWN: {grass}, Direction.RIGHT: {road}},
+            allowed_rotations=set(AllRotations),
+        ),
+        TileDefinition("shore", {Direction.LEFT: {grass}, Direction.UP: {grass}, Direction.DOWN: {grass}, Direction.RIGHT: {water}}),
+    ]
+
+    rule_set, report = optimise_rule_set(compile_rule_set(tile_definitions))
+
+    assert report == OptimisationReport(deployments_before=9, deployments_after=3, merged=5, pruned=1)
+    assert [deployment.id for deployment in rule_set.deployments] == ["grass", "road", "road"]
+    assert {deployment.rotation % 180 for deployment in rule_set.deployments[1:]} == {0, 90}
+    assert rule_set.deployment_weights == [8.0, 0.5, 0.5]
+
+    # A horizontal road still continues into a horizontal road, and never into a vertical one
+    horizontal = rule_set.deployments.index(TileDeployment("road"))
+    assert rule_set.adjacency[Direction.RIGHT][horizontal] == 1 << horizontal
+
+
+def test_optimised_rules_still_collapse():
+    for rules in EXAMPLE_RULES:
+        rule_set, _ = optimise_rule_set(compile_rule_set(YamlRulesLoader(rules).load()))
+
+        random.seed(1)
+        grid = Grid(12, rule_set)
+        grid.collapse()
+
+        assert grid.is_valid()
@@ -0,0 +1,42 @@
+import itertools
+from wfc.topology import *
+
+_offsets = {
+    Direction.LEFT: (0, 0, -1),
+    Direction.RIGHT: (0, 0, 1),
+    Direction.UP: (0, -1, 0),
+    Direction.DOWN: (0, 1, 0),
+    Direction.BELOW: (-1, 0, 0),
+    Direction.ABOVE: (1, 0, 0),
+}
+
+
+def test_neighbour_tables_match_coordinates():
+    for dimensions in [(7,), (3, 5), (4, 3, 5), (1, 2, 3)]:
+        for periodic in (False, True, (True,) + (False,) * (len(dimensions) - 1)):
+            topology = GridTopology(dimensions, periodic)
+            tables = dict(topology.neighbours)
+
+            assert len(tables) == 2 * len(dimensions)
+
+            for coordinate in itertools.product(*(range(length) for length in dimensions)):
+                cell_idx = topology.index(coordinate)
+                assert topology.coordinate(cell_idx) == coordinate
+
+                for direction, table in tables.items():
+                    offset = _offsets[direction][-len(dimensions) :]
+                    neighbour = [value + step for value, step in zip(coordinate, offset)]
+
+                    for axis, length in enumerate(dimensions):
+                        if topology.periodic[axis]:
+                            neighbour[axis] %= length
+
+                    expected = topology.index(tuple(neighbour)) if topology.contains(tuple(neighbour)) else -1
+                    assert table[cell_idx] == expected
+
+
+def test_nest_splits_cells_by_axis():
+    topology = GridTopology((2, 3, 4))
+
+    assert topology.nest(list(range(24)))[1][2] == [20, 21, 22, 23]
+    assert topology.directions == [Direction.LEFT, Direction.UP, Direction.DOWN, Direction.RIGHT, Direction.ABOVE, Direction.BELOW]
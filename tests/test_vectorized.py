@@ -0,0 +1,107 @@
+import random
+from pathlib import Path
+from wfc import basic, vectorized
+from benchmark import synthetic_tile_definitions
+from wfc.basic_socket import BasicSocket, SocketType
+from wfc.ruleset import compile_rule_set
+from wfc.tile import TileDefinition
+from helpers.direction import Direction
+from rule_loaders.yaml import YamlRulesLoader
+
+EXAMPLE_RULES = [
+    Path("examples/abstract/abstract.yaml"),
+    Path("examples/grassy_roads/grassy_roads.yaml"),
+]
+
+
+def test_vectorized_grid_matches_basic_grid():
+    for rules in EXAMPLE_RULES:
+        tile_definitions = YamlRulesLoader(rules).load()
+
+        for seed in range(3):
+            random.seed(seed)
+            basic_grid = basic.Grid(12, tile_definitions)
+            basic_grid.collapse()
+
+            random.seed(seed)
+            vectorized_grid = vectorized.Grid(12, tile_definitions)
+            vectorized_grid.collapse()
+
+            assert vectorized_grid.is_valid()
+            assert vectorized_grid.has_collapsed()
+            assert vectorized_grid.get_grid() == basic_grid.get_grid()
+
+
+def test_vectorized_grid_matches_basic_grid_beyond_one_word_of_deployments():
+    rule_set = compile_rule_set(synthetic_tile_definitions(30, 6, seed=0))
+    assert len(rule_set.deployments) > 64
+
+    for seed in range(2):
+        basic_grid = basic.Grid(12, rule_set, rng=random.Random(seed))
+        basic_grid.collapse()
+
+        vectorized_grid = vectorized.Grid(12, rule_set, rng=random.Random(seed))
+        vectorized_grid.collapse()
+
+        assert vectorized_grid.get_grid() == basic_grid.get_grid()
+        assert vectorized_grid.get_deployment_indices() == basic_grid.get_deployment_indices()
+
+
+def test_vectorized_grid_rules_out_deployments_without_partners_like_basic_grid():
+    grass = BasicSocket("grass", SocketType.SYMMETRIC)
+    water = BasicSocket("water", SocketType.SYMMETRIC)
+
+    # A shore has no partner to its right, so it can only be placed along the right edge
+    tile_definitions = [
+        TileDefinition("grass", {direction: {grass} for direction in Direction}),
+        TileDefinition("shore", {Direction.LEFT: {grass}, Direction.UP: {grass}, Direction.DOWN: {grass}, Direction.RIGHT: {water}}),
+    ]
+
+    for seed in range(3):
+        basic_grid = basic.Grid(6, tile_definitions, rng=random.Random(seed))
+        vectorized_grid = vectorized.Grid(6, tile_definitions, rng=random.Random(seed))
+
+        assert vectorized_grid.pretty_print_grid_state() == basic_grid.pretty_print_grid_state()
+
+        basic_grid.collapse()
+        vectorized_grid.collapse()
+
+        assert vectorized_grid.is_valid()
+        assert vectorized_grid.get_grid() == basic_grid.get_grid()
+
+
+def test_vectorized_single_steps_match_basic_grid():
+    tile_definitions = YamlRulesLoader(EXAMPLE_RULES[1]).load()
+
+    random.seed(7)
+    basic_grid = basic.Grid(8, tile_definitions)
+    random.seed(7)
+    vectorized_grid = vectorized.Grid(8, tile_definitions)
+
+    for coordinate in [(0, 0), (7, 7), (3, 4), (3, 5)]:
+        random.seed(sum(coordinate))
+        basic_grid.collapse_tile_superposition(coordinate)
+        random.seed(sum(coordinate))
+        vectorized_grid.collapse_tile_superposition(coordinate)
+
+        assert vectorized_grid.pretty_print_grid_state() == basic_grid.pretty_print_grid_state()
+        assert vectorized_grid.find_lowest_entropy_tile_superposition() == basic_grid.find_lowest_entropy_tile_superposition()
+
+
+def test_vectorized_changes_match_basic_grid():
+    tile_definitions = YamlRulesLoader(EXAMPLE_RULES[0]).load()
+
+    random.seed(5)
+    basic_grid = basic.Grid(8, tile_definitions)
+    random.seed(5)
+    vectorized_grid = vectorized.Grid(8, tile_definitions)
+
+    assert vectorized_grid.get_changes() == basic_grid.get_changes()
+
+    for coordinate in [(2, 2), (6, 1), (0, 7)]:
+        random.seed(sum(coordinate))
+        basic_grid.collapse_tile_superposition(coordinate)
+        random.seed(sum(coordinate))
+        vectorized_grid.collapse_tile_superposition(coordinate)
+
+        assert vectorized_grid.get_changes() == basic_grid.get_changes()
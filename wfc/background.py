@@ -0,0 +1,62 @@
+import threading
+from wfc import basic, vectorized
+from wfc.basic import Coordinate, TileSuperposition
+
+
+class BackgroundSolver:
+    """
+    Collapses a grid on a worker thread, one cell at a time, so that the caller can keep rendering and handling input.
+
+    The grid must not be used directly while a solve is running. Progress is published as changes, which the caller
+    can pick up with `get_changes` at its own pace, and a running solve can be cancelled between any two steps.
+    """
+
+    def __init__(self, grid: basic.Grid | vectorized.Grid) -> None:
+        self._grid = grid
+
+        # Held by the worker thread for each step, and by the caller while it reads the changes
+        self._lock = threading.Lock()
+
+        self._cancelled = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start collapsing the rest of the grid in the background, unless a solve is already running."""
+
+        if self.is_running():
+            return
+
+        self._cancelled.clear()
+        self._thread = threading.Thread(target=self._run, name="wfc-solver", daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stop a running solve after its current step, and wait for it to stop. The grid is left partly collapsed."""
+
+        self._cancelled.set()
+        self.wait()
+
+    def wait(self) -> None:
+        """Wait for a running solve to finish."""
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_changes(self) -> list[tuple[Coordinate, TileSuperposition]]:
+        """Return the cells that have changed since the last call, as `Grid.get_changes` does, even while a solve is running."""
+
+        with self._lock:
+            return self._grid.get_changes()
+
+    def _run(self) -> None:
+        while not self._cancelled.is_set():
+            with self._lock:
+                coordinate = self._grid.find_lowest_entropy_tile_superposition()
+
+                if coordinate is None:
+                    return
+
+                self._grid.collapse_tile_superposition(coordinate)
@@ -1,13 +1,23 @@
-from dataclasses import dataclass
+from array import array
+import bisect
+from collections import deque
+from dataclasses import asdict, dataclass, field
+import heapq
+import itertools
+import json
+import math
 import random
+import struct
+import time
+from typing import Iterable, Iterator, Mapping
 from enum import Enum
-from helpers.rotation import Rotation
-from wfc.abstract_socket import SocketSet
-from wfc.tile import TileDefinition, TileID, DirectionalSocketSetMap, rotate_socket_sets
+from wfc.ruleset import AdjacencyTable, RuleSet, TileDeployment, compile_rule_set, socket_sets_are_compatible
+from wfc.tile import TileDefinition, TileID
+from wfc.topology import GridTopology
 from helpers.direction import Direction, opposite_direction
 
 
-Entropy = int
+Entropy = float
 
 
 class Superposition(Enum):
@@ -18,15 +28,93 @@ class Superposition(Enum):
     INVALID = 2
 
 
+class PropagationEngine(Enum):
+    """Selects how a grid propagates the effects of collapsing a cell."""
+
+    WORKLIST = 0
+    """Re-check every neighbour of a changed cell against the changed cell's whole possibility set."""
+
+    SUPPORT_COUNT = 1
+    """
+    AC-4 style: count, for every cell, direction and deployment, how many compatible deployments the neighbour still has,
+    and only propagate the deployments that were removed.
+    This engine is opt-in: it is slower than `WORKLIST` on every rule set and grid size in `benchmark.py --engine`, because
+    keeping the counts costs more in Python than re-checking whole possibility sets, and the counts add roughly a byte
+    per cell, direction and deployment. It reaches exactly the same states as `WORKLIST`: a pass that would leave a cell
+    with no possibilities is undone and made again the way `WORKLIST` makes it, so a contradiction empties the same cells.
+    """
+
+
+class EntropyHeuristic(Enum):
+    """Selects how a grid measures the entropy of a cell when choosing which cell to collapse next."""
+
+    POSSIBILITY_COUNT = 0
+    """The number of deployments the cell could still become."""
+
+    WEIGHTED_SHANNON = 1
+    """The Shannon entropy of the cell's remaining deployments, weighted by their probability weights."""
+
+
 @dataclass(frozen=True)
-class TileDeployment:
-    """Describes a tile in a specific position."""
+class BacktrackingPolicy:
+    """Describes how a grid recovers when propagation leaves a cell with no possibilities."""
 
-    id: TileID
-    rotation: Rotation = Rotation.NONE
+    max_depth: int = 8
+    """How many of the most recent collapse decisions are remembered, and so can be undone."""
+
+    max_restarts: int = 0
+    """How many times the grid may start again from scratch when undoing decisions cannot remove the contradiction."""
 
 
 @dataclass
+class GridStats:
+    """Counters and per-phase timers that a grid keeps up to date when it is given an instance of this class."""
+
+    selections: int = 0
+    """Calls to find the lowest entropy cell."""
+
+    collapses: int = 0
+    """Cells collapsed by choice (rather than by propagation)."""
+
+    propagations: int = 0
+    """Changes propagated from a single cell to the rest of the grid."""
+
+    propagation_steps: int = 0
+    """Items taken off a propagation worklist: (cell, direction, neighbour) checks, or cells with removals (AC-4)."""
+
+    max_worklist_length: int = 0
+    """The longest any propagation worklist became."""
+
+    cells_narrowed: int = 0
+    possibilities_removed: int = 0
+
+    contradictions: int = 0
+    """Cells left with no possibilities."""
+
+    backtracks: int = 0
+    """Decisions undone by backtracking."""
+
+    restarts: int = 0
+
+    select_seconds: float = 0.0
+    collapse_seconds: float = 0.0
+    propagate_seconds: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+
+class GridObserver:
+    """Receives events from a grid as they happen. Override the methods for the events of interest."""
+
+    def on_collapse(self, coordinate: "Coordinate", deployment: TileDeployment) -> None:
+        """A cell was collapsed by choice to the given deployment."""
+
+    def on_contradiction(self, coordinate: "Coordinate") -> None:
+        """A cell was left with no possibilities."""
+
+
+@dataclass(frozen=True, slots=True)
 class TileSuperposition:
     """Describes a superposition of tiles."""
 
@@ -38,141 +126,487 @@ class TileSuperposition:
     Otherwise, this field will contain a valid `Tile` instance.
     """
 
-@dataclass
-class _InternalTileDeployment:
-    tile_deployment: TileDeployment
-    socket_sets: DirectionalSocketSetMap
 
+_invalid = TileSuperposition(Superposition.INVALID, None)
+_uncollapsed = TileSuperposition(Superposition.SUPERPOSITION, None)
 
-Coordinate = tuple[int, int]
 
+Coordinate = tuple[int, ...]
+"""The position of a cell: (row, column) in a 2D grid, or (layer, row, column) in a 3D one."""
 
-class _TileSuperposition:
-    def __init__(self, possibilities: list[_InternalTileDeployment]) -> None:
-        if len(possibilities) == 0:
-            raise RuntimeError("Cannot create a superposition containing zero possibilities")
+GridDimensions = tuple[int, ...]
+"""The number of (rows, columns) in a 2D grid, or of (layers, rows, columns) in a 3D one."""
 
-        self._possibilities: list[_InternalTileDeployment] = possibilities.copy()
 
-    def has_collapsed(self) -> bool:
-        return len(self._possibilities) == 1
+PossibilitySet = int
+"""
+A bitmask of the deployments that a cell could still become, where bit I stands for the deployment with index I.
 
-    def is_valid(self) -> bool:
-        return len(self._possibilities) > 0
+An empty set (zero) means the cell is invalid, and a set with exactly one bit means the cell has collapsed.
+"""
+
+
+DecisionLog = array
+"""
+The decisions that produced a grid, as a flat `array("i")` of (cell index, entry) pairs in the order they were made.
+
+An entry of I (zero or more) means the cell was collapsed to the deployment with index I, and an entry of ~I
+(below zero) means that deployment was ruled out for the cell by backtracking.
+"""
+
+
+_cumulative_weights_cache_size = 4096
+"""How many distinct possibility sets a grid keeps cumulative weight tables for."""
+
+_min_entropy_heap_limit = 64
+"""The fewest entries the entropy heap may hold before it is compacted."""
 
-    def get_possibilities(self) -> list[_InternalTileDeployment]:
-        return self._possibilities
+_double = struct.Struct("<d")
+_unsigned_64 = struct.Struct("<Q")
 
-    def remove(self, possibility: _InternalTileDeployment) -> None:
-        if possibility in self._possibilities:
-            self._possibilities.remove(possibility)
 
-    def propagate(self, other: "_TileSuperposition", direction: Direction) -> bool:
+@dataclass(slots=True)
+class _Decision:
+    """A cell that was collapsed by choice, plus the changes made to the grid as a result, so that it can be undone."""
+
+    cell_idx: int
+    deployment: int
+
+    log_length: int
+    """The length of the decision log before this decision was added to it."""
+
+    trail: list[tuple[int, PossibilitySet]] = field(default_factory=list)
+    """(cell index, possibilities before the change) for every change made since this decision, oldest first."""
+
+
+def _has_collapsed(possibilities: PossibilitySet) -> bool:
+    return possibilities != 0 and possibilities & (possibilities - 1) == 0
+
+
+def encode_decision_log(decision_log: DecisionLog) -> bytes:
+    """
+    Encode a decision log compactly, to be stored in place of the tiles of the grid it produced.
+
+    The decisions are sorted by cell, which `Grid.replay_decision_log` does not depend on, and each is written as one
+    varint holding the gap since the previous decision's cell, shifted left to make room for the entry.
+    When most cells are decisions and there are fewer than 64 deployments, most decisions take a single byte.
+    """
+
+    if len(decision_log) % 2 != 0:
+        raise RuntimeError("A decision log must hold (cell index, entry) pairs")
+
+    decisions = sorted(zip(decision_log[0::2], decision_log[1::2]))
+
+    # Entries of I and ~I become 2I and 2I + 1
+    entry_codes = [entry << 1 if entry >= 0 else (~entry << 1) | 1 for (_, entry) in decisions]
+    entry_bits = max(entry_codes, default=0).bit_length()
+
+    encoded = bytearray([entry_bits])
+    previous_cell_idx = 0
+
+    for (cell_idx, _), entry_code in zip(decisions, entry_codes):
+        value = ((cell_idx - previous_cell_idx) << entry_bits) | entry_code
+        previous_cell_idx = cell_idx
+
+        while value >= 0x80:
+            encoded.append((value & 0x7F) | 0x80)
+            value >>= 7
+
+        encoded.append(value)
+
+    return bytes(encoded)
+
+
+def decode_decision_log(encoded: bytes) -> DecisionLog:
+    """Decode a decision log from `encode_decision_log`, with its decisions sorted by cell."""
+
+    entry_bits = encoded[0]
+    entry_mask = (1 << entry_bits) - 1
+
+    decision_log: DecisionLog = array("i")
+    cell_idx, value, shift = (0, 0, 0)
+
+    for byte in memoryview(encoded)[1:]:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if byte & 0x80:
+            continue
+
+        cell_idx += value >> entry_bits
+        entry_code = value & entry_mask
+        decision_log.extend((cell_idx, entry_code >> 1 if entry_code & 1 == 0 else ~(entry_code >> 1)))
+        value, shift = (0, 0)
+
+    return decision_log
+
+
+def _entropy_key(entropy: Entropy) -> int:
+    """Return an integer that orders like the given entropy: the bits of a non-negative float sort the same way as its value."""
+
+    return _unsigned_64.unpack(_double.pack(entropy if entropy > 0.0 else 0.0))[0]
+
+
+def _iterate_indices(possibilities: PossibilitySet) -> Iterator[int]:
+    """Yield the deployment indices in a possibility set, lowest first."""
+
+    while possibilities:
+        lowest_bit = possibilities & -possibilities
+        yield lowest_bit.bit_length() - 1
+        possibilities ^= lowest_bit
+
+
+class Grid:
+    def __init__(
+        self,
+        grid_size: int | GridDimensions,
+        tile_definitions: list[TileDefinition] | RuleSet,
+        engine: PropagationEngine = PropagationEngine.WORKLIST,
+        entropy_heuristic: EntropyHeuristic = EntropyHeuristic.POSSIBILITY_COUNT,
+        backtracking: BacktrackingPolicy | None = None,
+        stats: GridStats | None = None,
+        observer: GridObserver | None = None,
+        rng: random.Random | None = None,
+        periodic: bool | tuple[bool, ...] = False,
+    ) -> None:
         """
-        Given the remaining possible states for this superposition, and therefore the remaining possible sockets
-        in the given direction, propagate this information to the other superposition.
+        Create a grid where every cell could be any deployment of the given tiles.
+
+        `grid_size` is either the length of the side of a square grid, or the (rows, columns) of a rectangular one,
+        or the (layers, rows, columns) of a 3D grid. A 3D grid needs tiles with sockets above and below them.
+        The tiles can be given already compiled, to save compiling the same rules for every grid.
 
-        Return whether or not the other superposition was affected by this propagation.
+        A `periodic` grid wraps around, either along every axis or along the axes given as `True`.
+
+        Both propagation engines reach the same states. `PropagationEngine.SUPPORT_COUNT` is opt-in, and slower than the default.
+
+        Without a `backtracking` policy, a contradiction is left in the grid as invalid cells.
+
+        If `stats` is given, the grid counts and times its work in it, and if an `observer` is given, the grid tells it
+        about collapses and contradictions. Without them, the grid does no extra work.
+
+        Random choices are drawn from `rng`, or from the `random` module if it is not given.
         """
 
-        possible_sockets: SocketSet = set()
-        possible_socketsets: list[SocketSet] = [p.socket_sets[direction] for p in self._possibilities]
-        for ss in possible_socketsets:
-            possible_sockets = possible_sockets.union(ss)
+        self._topology = GridTopology((grid_size, grid_size) if isinstance(grid_size, int) else grid_size, periodic)
+        self._engine = engine
+        self._entropy_heuristic = entropy_heuristic
+        self._backtracking = backtracking
+        self._stats = stats
+        self._observer = observer
+        self._random = rng.random if rng is not None else random.random
+        self._restarts = 0
+
+        # Cell index --> the deployments it has been constrained to, so that constraints survive a restart
+        self._constraints: dict[int, PossibilitySet] = {}
+
+        self._rule_set: RuleSet = tile_definitions if isinstance(tile_definitions, RuleSet) else compile_rule_set(tile_definitions)
+        self._deployments: list[TileDeployment] = self._rule_set.deployments
+        self._deployment_indices: dict[TileDeployment, int] = {deployment: index for index, deployment in enumerate(self._deployments)}
+        self._adjacency: AdjacencyTable = self._rule_set.adjacency
+
+        if len(self._deployments) == 0:
+            raise RuntimeError("Cannot create a grid from zero tile deployments")
+
+        missing_directions = [direction.name for direction in self._topology.directions if direction not in self._adjacency]
+        if missing_directions:
+            raise RuntimeError(
+                f"A grid with {len(self._topology.dimensions)} axes needs tiles with sockets {', '.join(missing_directions)} of them"
+            )
+
+        # Per direction: (the neighbour table, the adjacency in that direction, the position of the opposite direction),
+        # with the directions in the same order as the support counts of each cell
+        positions = {direction: position for position, direction in enumerate(self._topology.directions)}
+        self._neighbours: list[tuple[array, list[PossibilitySet], int]] = [
+            (table, self._adjacency[direction], positions[opposite_direction[direction]]) for direction, table in self._topology.neighbours
+        ]
 
-        possibilities_to_remove: list[_InternalTileDeployment] = []
-        for other_possibility in other.get_possibilities():
-            other_socket_set = other_possibility.socket_sets[opposite_direction[direction]]
-            if not socket_sets_are_compatible(other_socket_set, possible_sockets):
-                possibilities_to_remove.append(other_possibility)
+        self._all_possibilities: PossibilitySet = (1 << len(self._deployments)) - 1
 
-        for p in possibilities_to_remove:
-            other.remove(p)
+        # Per direction position: the deployments with no compatible partner at all in that direction, which can never be
+        # placed in a cell that has a neighbour in that direction
+        self._unsupported: list[PossibilitySet] = [
+            sum(1 << index for index, compatible in enumerate(compatible_in_direction) if compatible == 0)
+            for (_, compatible_in_direction, _) in self._neighbours
+        ]
+
+        # Single-deployment sets are shared so that a collapsed grid costs one pointer per cell
+        self._collapsed_possibilities: list[PossibilitySet] = [1 << index for index in range(len(self._deployments))]
 
-        return len(possibilities_to_remove) > 0
+        # Likewise, `get_grid` hands out one shared (immutable) `TileSuperposition` per deployment
+        self._collapsed_superpositions: list[TileSuperposition] = [
+            TileSuperposition(Superposition.COLLAPSED, deployment) for deployment in self._deployments
+        ]
 
-    def collapse(self, final_state: _InternalTileDeployment) -> None:
-        """Collapse the superposition into a single known state."""
+        # Possibility set --> (deployment indices, running total of their weights), for sampling a cell's final state
+        self._cumulative_weights: dict[PossibilitySet, tuple[list[int], list[float]]] = {}
 
-        if final_state not in self._possibilities:
-            raise RuntimeError("Cannot collapse superposition into a state that is not one of its possibilities")
+        # Each cell gets a fixed random tie-breaker (see `_draw_tie_breakers`), which is only drawn once the grid first
+        # makes a random choice, so that replaying a decision log draws nothing from `rng`
+        self._untouched_order: array[int] | None = None
+        self._tie_ranks: array[int] | None = None
+        self._rank_bits = max(self._topology.cell_count - 1, 1).bit_length()
 
-        self._possibilities = [final_state]
+        # Cells whose `TileSuperposition` may have changed since `get_changes` was last called. Nothing is tracked until
+        # the first call, so a grid that is never asked for its changes (such as one solved headlessly) does no extra work.
+        self._changed_cells: set[int] | None = None
 
-    def get_entropy(self) -> Entropy:
-        return len(self._possibilities)
+        # (cell index, possibilities before the change) for every change made by the current support-count propagation pass
+        self._propagation_trail: list[tuple[int, PossibilitySet]] | None = None
 
-    def get_collapsed_state(self) -> _InternalTileDeployment:
-        if not self.is_valid():
-            raise RuntimeError("Cannot get collapsed state of an invalid supoerposition")
+        self._reset()
 
-        if not self.has_collapsed():
-            raise RuntimeError("Cannot get collapsed state of an uncollapsed superposition")
+    def _reset(self) -> None:
+        """Put every cell back into a superposition of all deployments."""
 
-        return self._possibilities[0]
+        cell_count = self._topology.cell_count
 
+        # Row-major, one possibility set per cell; every cell starts out sharing the same int object
+        self._wave: list[PossibilitySet] = [self._all_possibilities] * cell_count
 
-class Grid:
-    def __init__(self, grid_size: int, tile_definitions: list[TileDefinition]) -> None:
-        self._grid_size = grid_size
+        if self._entropy_heuristic == EntropyHeuristic.WEIGHTED_SHANNON:
+            self._initialise_weight_sums()
+
+        # Min-heap of entries for cells that have been narrowed, each a single int (see `_get_heap_key`) that orders cells
+        # by entropy and then by tie-breaker. Entries are pushed whenever a cell shrinks and are not removed eagerly:
+        # an entry that no longer matches its cell's key (or whose cell has collapsed or become invalid) is stale,
+        # and is discarded when it reaches the top, or when the heap is compacted because it has grown past its limit.
+        self._entropy_heap: list[int] = []
+        self._entropy_heap_limit = _min_entropy_heap_limit
+
+        # Cells that have never been narrowed are taken from `_untouched_order` instead, from this position onwards
+        self._full_entropy_key: int = self._get_entropy_key(0)
+        self._untouched_position = 0 if not _has_collapsed(self._all_possibilities) else cell_count
+
+        if self._engine == PropagationEngine.SUPPORT_COUNT:
+            self._initialise_support_counts()
+
+        # The most recent decisions, newest last. Without backtracking nothing is remembered.
+        max_depth = self._backtracking.max_depth if self._backtracking is not None else 0
+        self._decisions: deque[_Decision] = deque(maxlen=max_depth)
+
+        # Every decision still in effect (see `DecisionLog`), which a restart throws away along with the decisions
+        self._decision_log: DecisionLog = array("i")
+
+        # Set when a cell is left with no possibilities
+        self._contradiction = False
+
+        # Every cell has changed, so the next call to `get_changes` returns them all
+        if self._changed_cells is not None:
+            self._changed_cells.clear()
+        self._all_cells_changed = True
+
+        self._remove_unsupported_deployments()
+
+    def _remove_unsupported_deployments(self) -> None:
+        """
+        Rule out every deployment that has no compatible partner in the direction of one of a cell's neighbours, and propagate.
+
+        Without this, the wave would start out inconsistent, and each propagation engine would only find these deployments
+        impossible when it happened to look at them, so the engines could reach different states.
+        It costs nothing for rules where every deployment has a partner in every direction.
+        """
+
+        allowed_by_cell: dict[int, PossibilitySet] = {}
+
+        for (table, _, _), unsupported in zip(self._neighbours, self._unsupported):
+            if unsupported == 0:
+                continue
+
+            for cell_idx, neighbour_idx in enumerate(table):
+                if neighbour_idx >= 0:
+                    allowed_by_cell[cell_idx] = allowed_by_cell.get(cell_idx, self._all_possibilities) & ~unsupported
+
+        if len(allowed_by_cell) == 0:
+            return
+
+        self._constrain(allowed_by_cell)
 
-        self._tile_definitions = tile_definitions
+        # Cells left with the same possibilities go back to sharing one int object
+        shared: dict[PossibilitySet, PossibilitySet] = {}
+        for cell_idx, possibilities in enumerate(self._wave):
+            self._wave[cell_idx] = shared.setdefault(possibilities, possibilities)
 
-        self._tiles: list[_InternalTileDeployment] = []
-        for tile_def in tile_definitions:
-            self._tiles.extend(self._create_tile_deployments_from_tile_definition(tile_def))
+    def _initialise_support_counts(self) -> None:
+        tile_count = len(self._deployments)
 
-        self._tile_superpositions: list[list[_TileSuperposition]] = [
-            [_TileSuperposition(self._tiles) for _ in range(grid_size)] for _ in range(grid_size)
+        # A count never exceeds the number of deployments, so it is stored in the smallest type that can hold that
+        typecode = "B" if tile_count < 2**8 else "H" if tile_count < 2**16 else "i"
+
+        # Entry ((C * directions) + D) * T + I counts the deployments still possible in the neighbour of cell C in direction D
+        # (the position of the direction in the grid's topology) that are compatible with deployment I being placed in C.
+        # Every cell starts with the same counts.
+        directions = self._topology.directions
+        counts_per_cell = array(
+            typecode, [self._adjacency[direction][index].bit_count() for direction in directions for index in range(tile_count)]
+        )
+        self._support_counts: array[int] = counts_per_cell * self._topology.cell_count
+
+        # Per direction position, per deployment: the indices of the deployments compatible with it in that direction,
+        # and the mean number of them, for choosing the cheaper way to update the counts
+        self._partners: list[list[tuple[int, ...]]] = [
+            [tuple(_iterate_indices(compatible)) for compatible in self._adjacency[direction]] for direction in directions
         ]
+        self._mean_partner_counts: list[float] = [sum(map(len, partners)) / tile_count for partners in self._partners]
 
-    @staticmethod
-    def _create_tile_deployments_from_tile_definition(tile_def: TileDefinition) -> list[_InternalTileDeployment]:
-        tile_deployments: list[_InternalTileDeployment] = []
+        # (source cell index, neighbour cell index, deployments the neighbour lost all support for), waiting to be removed
+        self._pending_removals: list[tuple[int, int, PossibilitySet]] = []
 
-        for rotation in tile_def.allowed_rotations:
-            tile_deployments.append(_InternalTileDeployment(
-                TileDeployment(tile_def.id, rotation=rotation),
-                socket_sets=rotate_socket_sets(tile_def.socket_sets, rotation),
-            ))
+    def _initialise_weight_sums(self) -> None:
+        weights = self._rule_set.deployment_weights
 
-        return tile_deployments
+        # Per deployment: w, and w * log(w)
+        self._weights: list[float] = weights
+        self._weight_log_weights: list[float] = [w * math.log(w) if w > 0 else 0.0 for w in weights]
 
-    def is_valid(self) -> bool:
-        for row in self._tile_superpositions:
-            for tile_superposition in row:
-                if not tile_superposition.is_valid():
-                    return False
+        # Per cell: the sums of w and of w * log(w) over the cell's remaining deployments
+        cell_count = self._topology.cell_count
+        self._weight_sums: array[float] = array("d", [math.fsum(self._weights)]) * cell_count
+        self._weight_log_weight_sums: array[float] = array("d", [math.fsum(self._weight_log_weights)]) * cell_count
 
-        return True
+    def _update_weight_sums(self, cell_idx: int, remaining: PossibilitySet) -> None:
+        """
+        Bring a cell's weight sums up to date after its deployments changed.
 
-    def has_collapsed(self) -> bool:
-        for row in self._tile_superpositions:
-            for tile_superposition in row:
-                if not tile_superposition.has_collapsed():
-                    return False
+        The sums are added up afresh from the remaining deployments, rather than by subtracting what was removed,
+        so that they depend only on what is left and not on the order that it was removed in.
+        """
 
-        return True
+        self._weight_sums[cell_idx] = math.fsum(self._weights[index] for index in _iterate_indices(remaining))
+        self._weight_log_weight_sums[cell_idx] = math.fsum(self._weight_log_weights[index] for index in _iterate_indices(remaining))
+
+    def _get_entropy(self, cell_idx: int) -> Entropy:
+        if self._entropy_heuristic == EntropyHeuristic.WEIGHTED_SHANNON:
+            weight_sum = self._weight_sums[cell_idx]
+            return math.log(weight_sum) - self._weight_log_weight_sums[cell_idx] / weight_sum
+
+        return self._wave[cell_idx].bit_count()
+
+    def _get_entropy_key(self, cell_idx: int) -> int:
+        """Return a cell's entropy as an integer that orders the same way."""
+
+        if self._entropy_heuristic == EntropyHeuristic.WEIGHTED_SHANNON:
+            return _entropy_key(self._get_entropy(cell_idx))
+
+        return self._wave[cell_idx].bit_count()
+
+    def _get_heap_key(self, cell_idx: int) -> int:
+        """Return the entropy heap entry of a cell: its entropy key followed by its tie-breaker rank."""
+
+        return (self._get_entropy_key(cell_idx) << self._rank_bits) | self._tie_ranks[cell_idx]
+
+    def _draw_tie_breakers(self) -> None:
+        """
+        Give each cell a random tie-breaker, so the choice between cells of equal entropy is random (as with a full scan)
+        but does not depend on the order in which the propagation engine happened to visit cells.
+
+        This happens just before the grid first chooses a cell or a deployment, and so draws from `rng` in the same order
+        as if it had happened when the grid was created. Only each cell's rank among the tie-breakers is kept.
+        """
+
+        cell_count = self._topology.cell_count
+        tie_breakers = [self._random() for _ in range(cell_count)]
+
+        # Every cell index in order of tie-breaker, which is the order that cells still in their initial superposition
+        # (which all share the same entropy) are chosen in. A cell that has never been narrowed needs no heap entry.
+        self._untouched_order = array("i", sorted(range(cell_count), key=tie_breakers.__getitem__))
+
+        # Cell index --> its position in `_untouched_order`
+        self._tie_ranks = array("i", [0]) * cell_count
+        for rank, cell_idx in enumerate(self._untouched_order):
+            self._tie_ranks[cell_idx] = rank
+
+        # Cells narrowed before now (by constraints, or by replaying a decision log) have no heap entries yet
+        self._entropy_heap[:] = [
+            self._get_heap_key(cell_idx)
+            for cell_idx, possibilities in enumerate(self._wave)
+            if possibilities != self._all_possibilities and possibilities != 0 and not _has_collapsed(possibilities)
+        ]
+        heapq.heapify(self._entropy_heap)
+        self._entropy_heap_limit = max(2 * len(self._entropy_heap), _min_entropy_heap_limit)
+
+    def _push_entropy(self, cell_idx: int) -> None:
+        if self._tie_ranks is None:
+            return
+
+        heapq.heappush(self._entropy_heap, self._get_heap_key(cell_idx))
+
+        if len(self._entropy_heap) > self._entropy_heap_limit:
+            self._compact_entropy_heap()
+
+    def _compact_entropy_heap(self) -> None:
+        """Drop every stale entry from the entropy heap, and allow it to grow to twice its remaining size before doing so again."""
+
+        rank_mask = (1 << self._rank_bits) - 1
+        live_keys = set()
+
+        for key in self._entropy_heap:
+            cell_idx = self._untouched_order[key & rank_mask]
+            possibilities = self._wave[cell_idx]
+
+            if possibilities != 0 and not _has_collapsed(possibilities) and self._get_heap_key(cell_idx) == key:
+                live_keys.add(key)
+
+        self._entropy_heap[:] = live_keys
+        heapq.heapify(self._entropy_heap)
+        self._entropy_heap_limit = max(2 * len(self._entropy_heap), _min_entropy_heap_limit)
+
+    def is_valid(self) -> bool:
+        return all(self._wave)
+
+    def has_collapsed(self) -> bool:
+        return all(_has_collapsed(possibilities) for possibilities in self._wave)
 
     def get_grid_size(self) -> int:
-        return self._grid_size
+        dimensions = self._topology.dimensions
+
+        if len(dimensions) != 2 or dimensions[0] != dimensions[1]:
+            raise RuntimeError(f"Grid is not square ({'x'.join(map(str, dimensions))}), use get_dimensions() instead")
+
+        return dimensions[0]
+
+    def get_dimensions(self) -> GridDimensions:
+        return self._topology.dimensions
+
+    def get_rule_set(self) -> RuleSet:
+        return self._rule_set
+
+    def get_deployment_indices(self) -> array:
+        """Return the index of each cell's deployment in row-major order, as an `array("i")`, with -1 for cells that have not collapsed."""
+
+        return array("i", [possibilities.bit_length() - 1 if _has_collapsed(possibilities) else -1 for possibilities in self._wave])
 
     def get_grid(self) -> list[list[TileSuperposition]]:
-        result: list[list[TileSuperposition]] = []
+        """Return the state of every cell, as rows of cells (or, for a 3D grid, as layers of rows of cells)."""
 
-        for row_idx, row in enumerate(self._tile_superpositions):
-            result.append([])
+        return self._topology.nest([self._get_tile_superposition(possibilities) for possibilities in self._wave])
 
-            for tile_superposition in row:
-                if not tile_superposition.is_valid():
-                    result[row_idx].append(TileSuperposition(Superposition.INVALID, None))
-                elif tile_superposition.has_collapsed():
-                    internal_tile = tile_superposition.get_collapsed_state()
-                    result[row_idx].append(TileSuperposition(Superposition.COLLAPSED, internal_tile.tile_deployment))
-                else:
-                    result[row_idx].append(TileSuperposition(Superposition.SUPERPOSITION, None))
+    def get_changes(self) -> list[tuple[Coordinate, TileSuperposition]]:
+        """
+        Return the coordinates and new states of the cells that have become collapsed or invalid (or been put back into
+        a superposition by backtracking) since the last call, in row-major order.
+
+        The first call returns every cell, so a consumer can build its own copy of the grid from the changes alone.
+        Changes are only tracked from the first call onwards, so a grid that is never asked keeps no record of them.
+        """
+
+        changed_cells = range(len(self._wave)) if self._all_cells_changed or self._changed_cells is None else sorted(self._changed_cells)
+        changes = [(self._topology.coordinate(cell_idx), self._get_tile_superposition(self._wave[cell_idx])) for cell_idx in changed_cells]
+
+        # From now on, changes are tracked
+        self._changed_cells = set()
+        self._all_cells_changed = False
 
-        return result
+        return changes
+
+    def _get_tile_superposition(self, possibilities: PossibilitySet) -> TileSuperposition:
+        if possibilities == 0:
+            return _invalid
+
+        if _has_collapsed(possibilities):
+            return self._collapsed_superpositions[possibilities.bit_length() - 1]
+
+        return _uncollapsed
 
     def collapse(self) -> None:
         """Collapse the whole grid into a single known state."""
@@ -185,35 +619,73 @@ class Grid:
 
             self.collapse_tile_superposition(lowest_entropy_coordinate)
 
-    def _get_tile_superposition(self, coordinate: Coordinate) -> _TileSuperposition:
-        return self._tile_superpositions[coordinate[0]][coordinate[1]]
+    def _get_possibilities(self, coordinate: Coordinate) -> PossibilitySet:
+        return self._wave[self._topology.index(coordinate)]
 
-    def _is_coordinate_valid(self, coordinate: Coordinate) -> bool:
-        return coordinate[0] >= 0 and coordinate[0] < self._grid_size and coordinate[1] >= 0 and coordinate[1] < self._grid_size
-
-    def _get_valid_neighbours(self, coordinate: Coordinate) -> dict[tuple[Coordinate, Direction], Coordinate]:
+    def _propagate(self, source_idx: int, compatible_in_direction: list[PossibilitySet], neighbour_idx: int) -> bool:
         """
-        Return all valid neighbours of a coordinate.
+        Given the remaining possible deployments of the source cell, remove every deployment of the neighbour cell
+        (in the direction of the given adjacency) that no longer has a compatible partner in the source.
 
-        Return value is a dict (C, D) --> N where
-        C is the coordinate provided,
-        D is the direction from C,
-        N is the neighbour.
+        Return whether or not the neighbour was affected by this propagation.
         """
 
-        possible_neighbours = {
-            (coordinate, Direction.LEFT): (coordinate[0], coordinate[1] - 1),
-            (coordinate, Direction.UP): (coordinate[0] - 1, coordinate[1]),
-            (coordinate, Direction.DOWN): (coordinate[0] + 1, coordinate[1]),
-            (coordinate, Direction.RIGHT): (coordinate[0], coordinate[1] + 1),
-        }
+        allowed: PossibilitySet = 0
+        for index in _iterate_indices(self._wave[source_idx]):
+            allowed |= compatible_in_direction[index]
+
+        neighbour_possibilities = self._wave[neighbour_idx]
+        remaining = neighbour_possibilities & allowed
+
+        if remaining == neighbour_possibilities:
+            return False
+
+        self._narrow(neighbour_idx, remaining)
+        return True
+
+    def _narrow(self, cell_idx: int, remaining: PossibilitySet) -> None:
+        """Replace the possibilities of a cell with a smaller set, keeping the entropy bookkeeping up to date."""
+
+        possibilities = self._wave[cell_idx]
+        removed = possibilities & ~remaining
+
+        if self._decisions:
+            self._decisions[-1].trail.append((cell_idx, possibilities))
+
+        if self._propagation_trail is not None:
+            self._propagation_trail.append((cell_idx, possibilities))
+
+        if _has_collapsed(remaining):
+            remaining = self._collapsed_possibilities[remaining.bit_length() - 1]
+
+            if self._changed_cells is not None:
+                self._changed_cells.add(cell_idx)
+        elif remaining == 0:
+            self._contradiction = True
 
-        neighbours: dict[tuple[Coordinate, Direction], Coordinate] = {}
-        for k, n in possible_neighbours.items():
-            if self._is_coordinate_valid(n):
-                neighbours[k] = n
+            if self._changed_cells is not None:
+                self._changed_cells.add(cell_idx)
 
-        return neighbours
+            if self._stats is not None:
+                self._stats.contradictions += 1
+
+            if self._observer is not None:
+                self._observer.on_contradiction(self._topology.coordinate(cell_idx))
+
+        if self._stats is not None:
+            self._stats.cells_narrowed += 1
+            self._stats.possibilities_removed += removed.bit_count()
+
+        self._wave[cell_idx] = remaining
+
+        if self._engine == PropagationEngine.SUPPORT_COUNT:
+            self._remove_support(cell_idx, removed, remaining != 0)
+
+        if self._entropy_heuristic == EntropyHeuristic.WEIGHTED_SHANNON:
+            self._update_weight_sums(cell_idx, remaining)
+
+        if remaining != 0 and not _has_collapsed(remaining):
+            self._push_entropy(cell_idx)
 
     def find_lowest_entropy_tile_superposition(self) -> Coordinate | None:
         """
@@ -222,44 +694,101 @@ class Grid:
         `None` is returned if the grid is fully collapsed.
         """
 
-        lowest_entropy_indices: list[Coordinate] = []
-        lowest_entropy: Entropy = 99999
+        if self._stats is None:
+            return self._find_lowest_entropy_cell()
+
+        start = time.perf_counter()
+        coordinate = self._find_lowest_entropy_cell()
+
+        self._stats.selections += 1
+        self._stats.select_seconds += time.perf_counter() - start
+
+        return coordinate
 
-        for row_idx, row in enumerate(self._tile_superpositions):
-            for col_idx, tile_superposition in enumerate(row):
-                if tile_superposition.is_valid() and not tile_superposition.has_collapsed():
-                    if tile_superposition.get_entropy() < lowest_entropy:
-                        lowest_entropy_indices.clear()
-                        lowest_entropy = tile_superposition.get_entropy()
-                        lowest_entropy_indices.append((row_idx, col_idx))
+    def _find_lowest_entropy_cell(self) -> Coordinate | None:
+        if self._untouched_order is None:
+            self._draw_tie_breakers()
 
-                    elif tile_superposition.get_entropy() == lowest_entropy:
-                        lowest_entropy_indices.append((row_idx, col_idx))
+        rank_mask = (1 << self._rank_bits) - 1
+        heap_top: int | None = None
 
-        if len(lowest_entropy_indices) == 0:
-            return None
+        while len(self._entropy_heap) > 0:
+            key = self._entropy_heap[0]
+            cell_idx = self._untouched_order[key & rank_mask]
+            possibilities = self._wave[cell_idx]
 
-        lowest_entropy_index = random.choice(lowest_entropy_indices)
-        return lowest_entropy_index
+            if possibilities != 0 and not _has_collapsed(possibilities) and self._get_heap_key(cell_idx) == key:
+                heap_top = key
+                break
+
+            # Stale entry: the cell has changed since this entry was pushed
+            heapq.heappop(self._entropy_heap)
+
+        # Skip cells that have been narrowed since; any that were put back by backtracking have heap entries again
+        while (
+            self._untouched_position < len(self._untouched_order)
+            and self._wave[self._untouched_order[self._untouched_position]] != self._all_possibilities
+        ):
+            self._untouched_position += 1
+
+        # An untouched cell's tie-breaker rank is its position in `_untouched_order`
+        if self._untouched_position < len(self._untouched_order):
+            if heap_top is None or (self._full_entropy_key << self._rank_bits) | self._untouched_position < heap_top:
+                return self._topology.coordinate(self._untouched_order[self._untouched_position])
+
+        return self._topology.coordinate(self._untouched_order[heap_top & rank_mask]) if heap_top is not None else None
 
     def _collapse_tile_superposition(self, coordinate: Coordinate) -> None:
-        tile_superposition = self._get_tile_superposition(coordinate)
+        possibilities = self._get_possibilities(coordinate)
 
-        if not tile_superposition.is_valid() or tile_superposition.has_collapsed():
+        if possibilities == 0 or _has_collapsed(possibilities):
             return
 
-        current_possibilities = tile_superposition.get_possibilities()
+        if self._stats is not None:
+            start = time.perf_counter()
 
-        possible_tile_ids: set[TileID] = {p.tile_deployment.id for p in current_possibilities}
-        possible_tile_definitions: list[TileDefinition] = [d for d in self._tile_definitions if d.id in possible_tile_ids]
-        tile_definition_weights: list[float] = [d.prob_weight for d in self._tile_definitions if d.id in possible_tile_ids]
+        new_possibility = self._choose_deployment(possibilities)
+        cell_idx = self._topology.index(coordinate)
 
-        final_tile_definition: TileDefinition = random.choices(possible_tile_definitions, weights=tile_definition_weights)[0]
+        if self._backtracking is not None:
+            self._decisions.append(_Decision(cell_idx, new_possibility, len(self._decision_log)))
 
-        new_possibilities: list[_InternalTileDeployment] = [p for p in current_possibilities if p.tile_deployment.id == final_tile_definition.id]
-        new_possibility = random.choice(new_possibilities)
+        self._decision_log.extend((cell_idx, new_possibility))
+        self._narrow(cell_idx, 1 << new_possibility)
 
-        tile_superposition.collapse(new_possibility)
+        if self._stats is not None:
+            self._stats.collapses += 1
+            self._stats.collapse_seconds += time.perf_counter() - start
+
+        if self._observer is not None:
+            self._observer.on_collapse(coordinate, self._deployments[new_possibility])
+
+    def _choose_deployment(self, possibilities: PossibilitySet) -> int:
+        """
+        Randomly choose one deployment from a possibility set, in proportion to the deployment weights.
+
+        The running totals are worked out once per distinct possibility set and reused, so a draw is a single bisection.
+        """
+
+        if self._untouched_order is None:
+            self._draw_tie_breakers()
+
+        table = self._cumulative_weights.get(possibilities)
+
+        if table is None:
+            indices = list(_iterate_indices(possibilities))
+            totals = list(itertools.accumulate(self._rule_set.deployment_weights[i] for i in indices))
+
+            if len(self._cumulative_weights) >= _cumulative_weights_cache_size:
+                self._cumulative_weights.clear()
+
+            table = (indices, totals)
+            self._cumulative_weights[possibilities] = table
+
+        indices, totals = table
+        position = bisect.bisect_right(totals, self._random() * totals[-1])
+
+        return indices[min(position, len(indices) - 1)]
 
     def collapse_tile_superposition(self, coordinate: Coordinate) -> None:
         """
@@ -269,42 +798,343 @@ class Grid:
         Returns `False` otherwise, including when the grid is in a completely known state.
         """
 
+        possibilities_before = self._get_possibilities(coordinate)
+
         self._collapse_tile_superposition(coordinate)
 
-        neighbours_to_propagate_to = self._get_valid_neighbours(coordinate)
+        self._propagate_from([(self._topology.index(coordinate), possibilities_before & ~self._get_possibilities(coordinate))])
+
+        if self._contradiction and self._backtracking is not None:
+            self._recover_from_contradiction()
+
+    def constrain_tile_superposition(self, coordinate: Coordinate, allowed: Iterable[TileDeployment]) -> None:
+        """
+        Remove every possibility of a tile superposition apart from the allowed deployments,
+        and propagate the changes to the rest of the grid.
+
+        Constraints are not decisions, so backtracking never undoes them.
+        """
+
+        self.constrain_tile_superpositions([(coordinate, allowed)])
+
+    def constrain_tile_superpositions(
+        self, constraints: Mapping[Coordinate, Iterable[TileDeployment]] | Iterable[tuple[Coordinate, Iterable[TileDeployment]]]
+    ) -> None:
+        """
+        Constrain many tile superpositions at once, as `constrain_tile_superposition` does for one,
+        but with a single propagation pass for all of them rather than one per cell.
+
+        The constraints are either a mapping from coordinates to their allowed deployments,
+        or (coordinate, allowed deployments) pairs, where a coordinate given more than once is only allowed the deployments common to all.
+        """
+
+        allowed_by_cell: dict[int, PossibilitySet] = {}
+
+        for coordinate, allowed in constraints.items() if isinstance(constraints, Mapping) else constraints:
+            if not self._topology.contains(coordinate):
+                raise RuntimeError(
+                    f"Cannot constrain {coordinate}, which is outside the {'x'.join(map(str, self._topology.dimensions))} grid"
+                )
+
+            cell_idx = self._topology.index(coordinate)
+
+            allowed_possibilities: PossibilitySet = 0
+            for deployment in allowed:
+                allowed_possibilities |= 1 << self._deployment_indices[deployment]
+
+            allowed_by_cell[cell_idx] = allowed_by_cell.get(cell_idx, self._all_possibilities) & allowed_possibilities
+
+        for cell_idx, allowed_possibilities in allowed_by_cell.items():
+            self._constraints[cell_idx] = self._constraints.get(cell_idx, self._all_possibilities) & allowed_possibilities
+
+        self._constrain(allowed_by_cell)
+
+        if self._contradiction and self._backtracking is not None:
+            self._recover_from_contradiction()
+
+    def get_decision_log(self) -> DecisionLog:
+        """
+        Return a copy of the decisions that brought the grid to its current state.
+
+        A grid with the same size, rules and constraints reaches the same state from `replay_decision_log`,
+        which makes no random choices and never searches for a cell to collapse.
+        `encode_decision_log` stores a log in far less space than the grid's tiles would take.
+        """
+
+        return array("i", self._decision_log)
+
+    def replay_decision_log(self, decision_log: DecisionLog) -> None:
+        """Apply the decisions from another grid's `get_decision_log`, and propagate them all in a single pass."""
+
+        if len(decision_log) % 2 != 0:
+            raise RuntimeError("A decision log must hold (cell index, entry) pairs")
+
+        allowed_by_cell: dict[int, PossibilitySet] = {}
+
+        for position in range(0, len(decision_log), 2):
+            cell_idx, entry = (decision_log[position], decision_log[position + 1])
+
+            if not (0 <= cell_idx < len(self._wave) and -len(self._deployments) <= entry < len(self._deployments)):
+                raise RuntimeError(f"Decision ({cell_idx}, {entry}) does not fit this grid")
+
+            allowed = 1 << entry if entry >= 0 else self._all_possibilities & ~(1 << ~entry)
+            allowed_by_cell[cell_idx] = allowed_by_cell.get(cell_idx, self._all_possibilities) & allowed
+
+        self._constrain(allowed_by_cell)
+        self._decision_log.extend(decision_log)
+
+    def _constrain(self, allowed_by_cell: dict[int, PossibilitySet]) -> None:
+        """Narrow each cell to the deployments it is allowed, and then propagate all of the changes together."""
+
+        changes: list[tuple[int, PossibilitySet]] = []
+
+        for cell_idx, allowed in allowed_by_cell.items():
+            possibilities = self._wave[cell_idx]
+            remaining = possibilities & allowed
+
+            if remaining != possibilities:
+                self._narrow(cell_idx, remaining)
+                changes.append((cell_idx, possibilities & ~remaining))
+
+        if len(changes) > 0:
+            self._propagate_from(changes)
+
+    def _propagate_from(self, changes: list[tuple[int, PossibilitySet]]) -> None:
+        """Propagate changes to some cells (each paired with the deployments it lost) to the rest of the grid, to a fixed point."""
+
+        if self._stats is not None:
+            start = time.perf_counter()
+
+        # An invalid cell allows nothing, so it must not be propagated from or it would invalidate its neighbours
+        valid_cell_indices = [cell_idx for (cell_idx, _) in changes if self._wave[cell_idx] != 0]
+
+        if self._engine == PropagationEngine.SUPPORT_COUNT:
+            # The support counts were already updated as the cells were narrowed
+            self._propagation_trail = []
+            contradicted = not self._propagate_removals()
+            trail = self._propagation_trail
+            self._propagation_trail = None
+
+            # Which cells a contradiction empties depends on the order that removals are made in, so rather than leave
+            # the grid in a state that only this engine would reach, the pass is undone and made again as `WORKLIST` makes it
+            if contradicted:
+                self._pending_removals.clear()
+                if self._decisions:
+                    del self._decisions[-1].trail[len(self._decisions[-1].trail) - len(trail) :]
+
+                self._undo(trail)
+                self._propagate_worklist(valid_cell_indices)
+                self._pending_removals.clear()
+        else:
+            self._propagate_worklist(valid_cell_indices)
+
+        if self._stats is not None:
+            self._stats.propagations += 1
+            self._stats.propagate_seconds += time.perf_counter() - start
+
+    def _recover_from_contradiction(self) -> None:
+        """
+        Undo recent decisions until the grid no longer contains a contradiction.
+
+        If every remembered decision has been undone and the contradiction remains,
+        start again from scratch if the backtracking policy allows it, or otherwise leave the grid invalid.
+        """
+
+        assert self._backtracking is not None
+
+        while self._contradiction and len(self._decisions) > 0:
+            decision = self._decisions.pop()
+            self._undo(decision.trail)
+            self._contradiction = False
+
+            if self._stats is not None:
+                self._stats.backtracks += 1
+
+            # The decision led to a contradiction, so (given the decisions before it) the cell cannot be that deployment.
+            # This is a consequence of the earlier decisions, so it is recorded against them and undone along with them.
+            del self._decision_log[decision.log_length :]
+            self._decision_log.extend((decision.cell_idx, ~decision.deployment))
+
+            # Constraints applied since the earlier decisions were undone along with the decision, so they are applied again.
+            # Only the cells that the trail reset can have lost their constraints: every other cell is as it was.
+            allowed_by_cell = {cell_idx: self._constraints[cell_idx] for (cell_idx, _) in decision.trail if cell_idx in self._constraints}
+            allowed_by_cell[decision.cell_idx] = allowed_by_cell.get(decision.cell_idx, self._all_possibilities) & ~(
+                1 << decision.deployment
+            )
+
+            self._constrain(allowed_by_cell)
+
+        if self._contradiction and self._restarts < self._backtracking.max_restarts:
+            self._restarts += 1
+            self._reset()
+
+            if self._stats is not None:
+                self._stats.restarts += 1
+
+            self._constrain(self._constraints)
+
+    def _undo(self, trail: list[tuple[int, PossibilitySet]]) -> None:
+        """Put every cell changed in the trail back to how it was, newest change first."""
+
+        for cell_idx, possibilities in reversed(trail):
+            restored = possibilities & ~self._wave[cell_idx]
+
+            # Before the cell changes back, so that the neighbours are exactly as they were when the support was removed
+            if self._engine == PropagationEngine.SUPPORT_COUNT:
+                self._restore_support_counts(cell_idx, restored)
+
+            self._wave[cell_idx] = possibilities
+
+            if self._changed_cells is not None:
+                self._changed_cells.add(cell_idx)
+
+            if self._entropy_heuristic == EntropyHeuristic.WEIGHTED_SHANNON:
+                self._update_weight_sums(cell_idx, possibilities)
+
+            if not _has_collapsed(possibilities):
+                self._push_entropy(cell_idx)
+
+    def _propagate_worklist(self, cell_indices: list[int]) -> None:
+        # (source cell index, position of the direction in `_neighbours`) --> neighbour cell index
+        neighbours_to_propagate_to: dict[tuple[int, int], int] = {}
+        for cell_idx in cell_indices:
+            for position, (table, _, _) in enumerate(self._neighbours):
+                if (neighbour_idx := table[cell_idx]) >= 0:
+                    neighbours_to_propagate_to[(cell_idx, position)] = neighbour_idx
+
+        stats = self._stats
 
         while len(neighbours_to_propagate_to) > 0:
-            ((source_coords, direction), neighbour_coords) = neighbours_to_propagate_to.popitem()
+            if stats is not None:
+                stats.propagation_steps += 1
+                stats.max_worklist_length = max(stats.max_worklist_length, len(neighbours_to_propagate_to))
+
+            (source_idx, position), cell_idx = neighbours_to_propagate_to.popitem()
+
+            was_affected = self._propagate(source_idx, self._neighbours[position][1], cell_idx)
+
+            if was_affected and self._wave[cell_idx] != 0:
+                for position, (table, _, _) in enumerate(self._neighbours):
+                    neighbour_idx = table[cell_idx]
+
+                    # Don't try and propagate back where we just came from
+                    if neighbour_idx >= 0 and neighbour_idx != source_idx:
+                        neighbours_to_propagate_to[(cell_idx, position)] = neighbour_idx
+
+    def _remove_support(self, cell_idx: int, removed: PossibilitySet, is_valid: bool) -> None:
+        """
+        Take away the support that deployments removed from a cell gave to its neighbours (AC-4),
+        and queue the neighbouring deployments left without any support to be removed in turn.
+
+        Only the counts of deployments that the neighbours still have are kept up to date: the count of a removed deployment
+        is left as it was when it was removed, which is also what it is again when backtracking puts the deployment back.
+        Because of this, support must be removed as soon as a cell is narrowed, before any other cell changes.
+        """
+
+        tile_count = len(self._deployments)
+        direction_count = len(self._neighbours)
+        support_counts = self._support_counts
+        neighbours = self._neighbours
+        removed_count = removed.bit_count()
+
+        for position, (table, _, opposite_position) in enumerate(neighbours):
+            neighbour_idx = table[cell_idx]
+            if neighbour_idx < 0:
+                continue
+
+            counts_offset = (neighbour_idx * direction_count + opposite_position) * tile_count
+            neighbour_possibilities = self._wave[neighbour_idx]
+            lost: PossibilitySet = 0
+
+            if removed_count * self._mean_partner_counts[position] < neighbour_possibilities.bit_count():
+                # Few deployments removed: visit each of their partners that the neighbour still has
+                partners = self._partners[position]
+
+                for index in _iterate_indices(removed):
+                    for neighbour_index in partners[index]:
+                        if (neighbour_possibilities >> neighbour_index) & 1:
+                            support_counts[counts_offset + neighbour_index] -= 1
+
+                            if support_counts[counts_offset + neighbour_index] == 0:
+                                lost |= 1 << neighbour_index
+            else:
+                # Many deployments removed (such as by a collapse): visit each deployment the neighbour still has, and count
+                # how many of its partners towards this cell were removed
+                compatible_towards_cell = neighbours[opposite_position][1]
+                remaining_neighbour_possibilities = neighbour_possibilities
+
+                while remaining_neighbour_possibilities:
+                    lowest_bit = remaining_neighbour_possibilities & -remaining_neighbour_possibilities
+                    remaining_neighbour_possibilities ^= lowest_bit
+                    neighbour_index = lowest_bit.bit_length() - 1
+
+                    support_lost = (compatible_towards_cell[neighbour_index] & removed).bit_count()
+
+                    if support_lost > 0:
+                        support_counts[counts_offset + neighbour_index] -= support_lost
 
-            source = self._get_tile_superposition(source_coords)
-            new_neighbour = self._get_tile_superposition(neighbour_coords)
+                        if support_counts[counts_offset + neighbour_index] == 0:
+                            lost |= lowest_bit
 
-            was_affected = source.propagate(new_neighbour, direction)
+            # Counts are always kept up to date, but an invalid cell does not go on to constrain its neighbours
+            if is_valid and lost != 0:
+                self._pending_removals.append((cell_idx, neighbour_idx, lost))
 
-            if was_affected and new_neighbour.is_valid():
-                more_neighbours = self._get_valid_neighbours(neighbour_coords)
+    def _propagate_removals(self) -> bool:
+        """
+        Remove the deployments that lost all of their support, which may leave others without support, until none are left (AC-4).
+
+        Return `False`, and stop, rather than leave a cell with no possibilities.
+        """
+
+        pending_removals = self._pending_removals
+        stats = self._stats
+
+        while len(pending_removals) > 0:
+            if stats is not None:
+                stats.propagation_steps += 1
+                stats.max_worklist_length = max(stats.max_worklist_length, len(pending_removals))
+
+            source_idx, cell_idx, lost = pending_removals.pop()
+
+            possibilities = self._wave[cell_idx]
+            lost &= possibilities
+
+            if lost != 0 and self._wave[source_idx] != 0:
+                if possibilities == lost:
+                    return False
 
-                for key, new_neighbour in more_neighbours.items():
-                    # Don't add the new neighbour if it's the source that has just been processed
-                    # I.e. don't try and propagate back where we just came from
-                    if new_neighbour != source_coords:
-                        neighbours_to_propagate_to[key] = new_neighbour
+                self._narrow(cell_idx, possibilities & ~lost)
+
+        return True
+
+    def _restore_support_counts(self, cell_idx: int, restored: PossibilitySet) -> None:
+        """Give back the support that deployments restored to a cell provide to its neighbours, as `_remove_support` took it away."""
+
+        tile_count = len(self._deployments)
+        direction_count = len(self._neighbours)
+        support_counts = self._support_counts
+        neighbours = self._neighbours
+
+        for table, _, opposite_position in neighbours:
+            neighbour_idx = table[cell_idx]
+            if neighbour_idx < 0:
+                continue
+
+            counts_offset = (neighbour_idx * direction_count + opposite_position) * tile_count
+            compatible_towards_cell = neighbours[opposite_position][1]
+
+            for neighbour_index in _iterate_indices(self._wave[neighbour_idx]):
+                support_counts[counts_offset + neighbour_index] += (compatible_towards_cell[neighbour_index] & restored).bit_count()
 
     def pretty_print_grid_state(self) -> str:
         output: str = ""
-        for row in self._tile_superpositions:
-            for tile in row:
-                output += f"{[p.tile_deployment.id for p in tile.get_possibilities()]}, "
+        row_length = self._topology.dimensions[-1]
+        for row_start in range(0, len(self._wave), row_length):
+            for possibilities in self._wave[row_start : row_start + row_length]:
+                output += f"{[self._deployments[i].id for i in _iterate_indices(possibilities)]}, "
 
             output += "\n"
 
         return output
 
-
-def socket_sets_are_compatible(first: SocketSet, second: SocketSet) -> bool:
-    for fs in first:
-        for ss in second:
-            if fs.compatible_with(ss):
-                return True
-
-    return False
@@ -0,0 +1,323 @@
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+import json
+import random
+from typing import TextIO
+from wfc.basic import BacktrackingPolicy, Coordinate, Grid, GridDimensions
+from wfc.ruleset import RuleSet, TileDeployment, compile_rule_set
+from wfc.tile import TileDefinition
+from helpers.direction import Direction
+
+ChunkTiles = list[list[TileDeployment | None]]
+"""The rows of tiles in a chunk, with `None` for any cell that was left in a contradiction."""
+
+ChunkConstraints = list[tuple[Coordinate, list[TileDeployment]]]
+"""Cells of a chunk paired with the deployments they are allowed to collapse to. A cell may be constrained more than once."""
+
+
+class ChunkSink(ABC):
+    """Somewhere to send each chunk of a map as soon as it has been generated."""
+
+    @abstractmethod
+    def write_chunk(self, origin: Coordinate, tiles: ChunkTiles) -> None:
+        """Receive the tiles of a chunk whose top-left cell is at `origin` (row, column) in the map."""
+
+
+class JsonLinesChunkSink(ChunkSink):
+    """Writes each chunk as one line of JSON: its origin, plus rows of [tile ID, rotation] pairs."""
+
+    def __init__(self, output: TextIO) -> None:
+        self._output = output
+
+    def write_chunk(self, origin: Coordinate, tiles: ChunkTiles) -> None:
+        rows = [[[tile.id, int(tile.rotation)] if tile is not None else None for tile in row] for row in tiles]
+        self._output.write(json.dumps({"row": origin[0], "column": origin[1], "tiles": rows}) + "\n")
+
+
+def compatible_deployments(rule_set: RuleSet, neighbour: TileDeployment, direction: Direction) -> list[TileDeployment]:
+    """Return the deployments that may be placed in the given direction of an already-placed neighbour."""
+
+    neighbour_idx = rule_set.deployments.index(neighbour)
+    allowed = rule_set.adjacency[direction][neighbour_idx]
+
+    return [deployment for index, deployment in enumerate(rule_set.deployments) if (allowed >> index) & 1]
+
+
+def solve_chunk(
+    rule_set: RuleSet,
+    dimensions: GridDimensions,
+    constraints: ChunkConstraints,
+    seed: str,
+    max_attempts: int,
+    backtracking: BacktrackingPolicy | None,
+) -> tuple[ChunkTiles, bool]:
+    """
+    Collapse a grid for one chunk, with some of its cells constrained to the given deployments.
+
+    Each attempt is seeded from `seed` and the attempt number, so the result depends only on the arguments.
+    Returns the chunk's tiles, and whether they are free of contradictions.
+    """
+
+    for attempt in range(max_attempts):
+        grid = Grid(dimensions, rule_set, backtracking=backtracking, rng=random.Random(f"{seed}/{attempt}"))
+        grid.constrain_tile_superpositions(constraints)
+
+        grid.collapse()
+
+        if grid.is_valid():
+            break
+
+    tiles = [[cell.tile for cell in row] for row in grid.get_grid()]
+    return (tiles, grid.is_valid())
+
+
+class ChunkedMapGenerator:
+    """
+    Generates a map that is too large to hold in memory, one chunk at a time.
+
+    Chunks are solved row by row, left to right. Each chunk is constrained to fit the bottom row of the chunk above it
+    and the right-hand column of the chunk to its left, and is then sent to a sink and forgotten.
+    Only the current chunk, plus one row of tiles across the width of the map, are held in memory.
+    """
+
+    def __init__(
+        self,
+        tile_definitions: list[TileDefinition] | RuleSet,
+        map_dimensions: GridDimensions,
+        chunk_dimensions: GridDimensions,
+        seed: int,
+        max_attempts: int = 3,
+        backtracking: BacktrackingPolicy | None = BacktrackingPolicy(),
+    ) -> None:
+        self._rule_set: RuleSet = tile_definitions if isinstance(tile_definitions, RuleSet) else compile_rule_set(tile_definitions)
+        self._rows, self._columns = map_dimensions
+        self._chunk_rows, self._chunk_columns = chunk_dimensions
+        self._seed = seed
+        self._max_attempts = max_attempts
+        self._backtracking = backtracking
+
+    def generate(self, sink: ChunkSink) -> int:
+        """Generate every chunk of the map into the sink. Returns how many chunks were left with contradictions."""
+
+        failed_chunks = 0
+
+        # The bottom row of the previous row of chunks
+        border_above: list[TileDeployment | None] = [None] * self._columns
+
+        for chunk_row, row in enumerate(range(0, self._rows, self._chunk_rows)):
+            height = min(self._chunk_rows, self._rows - row)
+
+            next_border_above: list[TileDeployment | None] = [None] * self._columns
+            border_left: list[TileDeployment | None] = [None] * height
+
+            for chunk_column, column in enumerate(range(0, self._columns, self._chunk_columns)):
+                width = min(self._chunk_columns, self._columns - column)
+
+                constraints = self._border_constraints(border_above[column : column + width], border_left)
+                seed = f"{self._seed}/{chunk_row}/{chunk_column}"
+
+                tiles, valid = solve_chunk(self._rule_set, (height, width), constraints, seed, self._max_attempts, self._backtracking)
+                failed_chunks += not valid
+
+                sink.write_chunk((row, column), tiles)
+
+                next_border_above[column : column + width] = tiles[-1]
+                border_left = [tiles_row[-1] for tiles_row in tiles]
+
+            border_above = next_border_above
+
+        return failed_chunks
+
+    def _border_constraints(self, above: list[TileDeployment | None], left: list[TileDeployment | None]) -> ChunkConstraints:
+        """Constrain the top row and left-hand column of a chunk to fit the tiles already placed next to them."""
+
+        constraints: ChunkConstraints = []
+
+        for column, neighbour in enumerate(above):
+            if neighbour is not None:
+                constraints.append(((0, column), compatible_deployments(self._rule_set, neighbour, Direction.DOWN)))
+
+        for row, neighbour in enumerate(left):
+            if neighbour is not None:
+                constraints.append(((row, 0), compatible_deployments(self._rule_set, neighbour, Direction.RIGHT)))
+
+        return constraints
+
+
+class InfiniteWorld:
+    """
+    An unbounded map, generated lazily one chunk at a time around the cells that are asked for.
+
+    Chunks are cut along a lattice of seams: every chunk owns its top row and left-hand column.
+    The seams are solved first, from the world seed and their own position alone: a 3x3 block around each lattice point,
+    then a strip three cells wide between two of those blocks. Each chunk is then solved with all four of the seams around
+    it fixed. No chunk depends on any other chunk, so they can be generated in any order, neighbouring chunks always
+    agree along the seam between them, and an evicted chunk regenerates exactly as it was.
+
+    Solving the seams with a cell of context on either side makes it much more likely that a chunk can be fitted between
+    them, but rules with long-range structure can still leave a chunk with contradictions, which read back as `None`.
+
+    Solved chunks are kept in a least-recently-used cache, as arrays of deployment indices, up to `max_cache_bytes`.
+    """
+
+    def __init__(
+        self,
+        tile_definitions: list[TileDefinition] | RuleSet,
+        seed: int,
+        chunk_dimensions: GridDimensions = (32, 32),
+        max_cache_bytes: int = 64 * 1024 * 1024,
+        max_attempts: int = 5,
+        backtracking: BacktrackingPolicy | None = BacktrackingPolicy(),
+    ) -> None:
+        if min(chunk_dimensions) < 3:
+            raise RuntimeError(f"Chunks must be at least 3x3, not {chunk_dimensions[0]}x{chunk_dimensions[1]}")
+
+        self._rule_set: RuleSet = tile_definitions if isinstance(tile_definitions, RuleSet) else compile_rule_set(tile_definitions)
+        self._deployment_indices: dict[TileDeployment, int] = {deployment: i for i, deployment in enumerate(self._rule_set.deployments)}
+        self._seed = seed
+        self._chunk_rows, self._chunk_columns = chunk_dimensions
+        self._max_cache_bytes = max_cache_bytes
+        self._max_attempts = max_attempts
+        self._backtracking = backtracking
+
+        # Each chunk's tiles as row-major deployment indices, with -1 for a cell left in a contradiction
+        self._cache: OrderedDict[Coordinate, array] = OrderedDict()
+        self._cache_bytes = 0
+
+    def get_tile(self, coordinate: Coordinate) -> TileDeployment | None:
+        """Return the tile at a (row, column) coordinate anywhere in the world, generating its chunk if needed."""
+
+        chunk_row, row = divmod(coordinate[0], self._chunk_rows)
+        chunk_column, column = divmod(coordinate[1], self._chunk_columns)
+
+        index = self._get_chunk_indices((chunk_row, chunk_column))[row * self._chunk_columns + column]
+        return self._rule_set.deployments[index] if index >= 0 else None
+
+    def get_chunk(self, chunk_coordinate: Coordinate) -> ChunkTiles:
+        """Return the tiles of the chunk at a (chunk row, chunk column) coordinate, generating it if needed."""
+
+        indices = self._get_chunk_indices(chunk_coordinate)
+        deployments = self._rule_set.deployments
+
+        return [
+            [deployments[index] if index >= 0 else None for index in indices[row : row + self._chunk_columns]]
+            for row in range(0, len(indices), self._chunk_columns)
+        ]
+
+    def get_cached_chunk_count(self) -> int:
+        return len(self._cache)
+
+    def get_cache_bytes(self) -> int:
+        return self._cache_bytes
+
+    def _get_chunk_indices(self, chunk_coordinate: Coordinate) -> array:
+        indices = self._cache.get(chunk_coordinate)
+
+        if indices is not None:
+            self._cache.move_to_end(chunk_coordinate)
+            return indices
+
+        indices = array(
+            "i", [self._deployment_indices[tile] if tile is not None else -1 for row in self._solve_chunk(chunk_coordinate) for tile in row]
+        )
+
+        self._cache[chunk_coordinate] = indices
+        self._cache_bytes += indices.itemsize * len(indices)
+
+        # Always keep the chunk that was just solved, even if it alone is over the limit
+        while self._cache_bytes > self._max_cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.itemsize * len(evicted)
+
+        return indices
+
+    def _solve_chunk(self, chunk_coordinate: Coordinate) -> ChunkTiles:
+        """
+        Solve a chunk inside a grid one row and one column larger than it,
+        so that the seams of the chunks below and to the right can be fixed along with its own.
+        """
+
+        chunk_row, chunk_column = chunk_coordinate
+        rows, columns = (self._chunk_rows, self._chunk_columns)
+
+        top = self._row_seam(chunk_row, chunk_column) + [self._corner(chunk_row, chunk_column + 1)[1][1]]
+        bottom = self._row_seam(chunk_row + 1, chunk_column) + [self._corner(chunk_row + 1, chunk_column + 1)[1][1]]
+        left = self._column_seam(chunk_row, chunk_column)
+        right = self._column_seam(chunk_row, chunk_column + 1)
+
+        constraints: ChunkConstraints = []
+        for column in range(columns + 1):
+            constraints += _fixed(0, column, top[column]) + _fixed(rows, column, bottom[column])
+        for row in range(rows):
+            constraints += _fixed(row, 0, left[row]) + _fixed(row, columns, right[row])
+
+        seed = f"{self._seed}/chunk/{chunk_row}/{chunk_column}"
+        tiles, _ = solve_chunk(self._rule_set, (rows + 1, columns + 1), constraints, seed, self._max_attempts, self._backtracking)
+
+        # A seam cell that could not be solved was left unconstrained, so the chunks on either side of it may disagree about it
+        for column in range(columns):
+            tiles[0][column] = tiles[0][column] if top[column] is not None else None
+        for row in range(rows):
+            tiles[row][0] = tiles[row][0] if left[row] is not None else None
+
+        # Where a neighbouring chunk's seam cell was lost to a contradiction here, the cell next to it was never checked against it
+        for column in range(columns):
+            if tiles[rows][column] is None and not self._fits(bottom[column], tiles[rows - 1][column], Direction.UP):
+                tiles[rows - 1][column] = None
+        for row in range(rows):
+            if tiles[row][columns] is None and not self._fits(right[row], tiles[row][columns - 1], Direction.LEFT):
+                tiles[row][columns - 1] = None
+
+        return [tiles_row[:columns] for tiles_row in tiles[:rows]]
+
+    def _fits(self, neighbour: TileDeployment | None, tile: TileDeployment | None, direction: Direction) -> bool:
+        """Whether a tile may be placed in the given direction of its neighbour, where either of them may be missing."""
+
+        return neighbour is None or tile is None or tile in compatible_deployments(self._rule_set, neighbour, direction)
+
+    def _corner(self, chunk_row: int, chunk_column: int) -> ChunkTiles:
+        """The block of tiles centred on the top-left corner of a chunk, where its two seams meet."""
+
+        seed = f"{self._seed}/corner/{chunk_row}/{chunk_column}"
+        tiles, _ = solve_chunk(self._rule_set, (3, 3), [], seed, self._max_attempts, self._backtracking)
+
+        return tiles
+
+    def _row_seam(self, chunk_row: int, chunk_column: int) -> list[TileDeployment | None]:
+        """The top row of a chunk, from its own corner up to the corner of the chunk to its right."""
+
+        start, end = (self._corner(chunk_row, chunk_column), self._corner(chunk_row, chunk_column + 1))
+        columns = self._chunk_columns
+
+        constraints: ChunkConstraints = []
+        for row in range(3):
+            for column in range(2):
+                constraints += _fixed(row, column, start[row][column + 1])
+                constraints += _fixed(row, columns - 1 + column, end[row][column])
+
+        seed = f"{self._seed}/row/{chunk_row}/{chunk_column}"
+        tiles, _ = solve_chunk(self._rule_set, (3, columns + 1), constraints, seed, self._max_attempts, self._backtracking)
+
+        return tiles[1][:columns]
+
+    def _column_seam(self, chunk_row: int, chunk_column: int) -> list[TileDeployment | None]:
+        """The left-hand column of a chunk, from its own corner down to the corner of the chunk below it."""
+
+        start, end = (self._corner(chunk_row, chunk_column), self._corner(chunk_row + 1, chunk_column))
+        rows = self._chunk_rows
+
+        constraints: ChunkConstraints = []
+        for row in range(2):
+            for column in range(3):
+                constraints += _fixed(row, column, start[row + 1][column])
+                constraints += _fixed(rows - 1 + row, column, end[row][column])
+
+        seed = f"{self._seed}/column/{chunk_row}/{chunk_column}"
+        tiles, _ = solve_chunk(self._rule_set, (rows + 1, 3), constraints, seed, self._max_attempts, self._backtracking)
+
+        return [tiles_row[1] for tiles_row in tiles[:rows]]
+
+
+def _fixed(row: int, column: int, tile: TileDeployment | None) -> ChunkConstraints:
+    return [((row, column), [tile])] if tile is not None else []
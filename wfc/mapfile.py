@@ -0,0 +1,184 @@
+from array import array
+import json
+import mmap
+from pathlib import Path
+import struct
+import sys
+import numpy as np
+from wfc import basic, vectorized
+from wfc.basic import Coordinate, GridDimensions
+from wfc.chunked import ChunkSink, ChunkTiles
+from wfc.ruleset import TileDeployment
+from wfc.tile import TileID
+from helpers.rotation import Rotation
+
+_magic = b"WFCM"
+_format_version = 1
+
+_header = struct.Struct("<4sHHIIII")
+"""Magic, format version, reserved, rows, columns, length of the tile ID table, and offset of the cells."""
+
+_no_tile = 0xFFFF
+"""The value of a cell that holds no tile (it never collapsed, or was left in a contradiction)."""
+
+max_tile_count = _no_tile >> 2
+"""The most tiles a map file can refer to: each cell holds a tile index shifted left by two, plus its rotation."""
+
+_fill_slice_size = 1 << 20
+"""The number of bytes of empty cells written at a time when a map file is created."""
+
+
+def _encode(tile_index: int, rotation: Rotation) -> int:
+    return (tile_index << 2) | (int(rotation) // 90)
+
+
+class MapFileWriter(ChunkSink):
+    """
+    Writes a map into a compact binary file, which `MapFile` reads back.
+
+    The file is a small header, a JSON table of tile IDs, and then one little-endian uint16 per cell in row-major order:
+    the tile's index in the table shifted left by two, plus its rotation in quarter turns anticlockwise,
+    or 0xFFFF for a cell without a tile. The file is created at its full size up front and written through a memory map,
+    so a map can be written a chunk at a time (this is a `ChunkSink`) without ever being held in memory.
+    """
+
+    def __init__(self, path: Path, dimensions: GridDimensions, tile_ids: list[TileID]) -> None:
+        if len(tile_ids) > max_tile_count:
+            raise RuntimeError(f"A map file can refer to at most {max_tile_count} tiles, not {len(tile_ids)}")
+
+        self._rows, self._columns = dimensions
+        self._tile_indices: dict[TileID, int] = {tile_id: index for index, tile_id in enumerate(tile_ids)}
+
+        tile_table = json.dumps(tile_ids).encode()
+
+        # Cells start on an 8-byte boundary, so that they can be mapped straight into an array
+        self._cells_offset = -(-(_header.size + len(tile_table)) // 8) * 8
+
+        with path.open("wb") as file:
+            file.write(_header.pack(_magic, _format_version, 0, self._rows, self._columns, len(tile_table), self._cells_offset))
+            file.write(tile_table)
+            file.truncate(self._cells_offset + self._rows * self._columns * 2)
+
+        self._file = path.open("r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        # Every cell starts out without a tile, filled a slice at a time so that a huge map is never held in memory
+        empty_cells = b"\xff" * _fill_slice_size
+        for start in range(self._cells_offset, len(self._map), _fill_slice_size):
+            end = min(start + _fill_slice_size, len(self._map))
+            self._map[start:end] = empty_cells[: end - start]
+
+    def __enter__(self) -> "MapFileWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+    def write_chunk(self, origin: Coordinate, tiles: ChunkTiles) -> None:
+        """Write the tiles of a block of the map whose top-left cell is at `origin`."""
+
+        for row_offset, row in enumerate(tiles):
+            cells = array("H", [_encode(self._tile_indices[tile.id], tile.rotation) if tile is not None else _no_tile for tile in row])
+            self._write_cells((origin[0] + row_offset) * self._columns + origin[1], cells)
+
+    def write_grid(self, grid: basic.Grid | vectorized.Grid) -> None:
+        """Write a whole grid of the same dimensions as the map, straight from its deployment indices."""
+
+        if grid.get_dimensions() != (self._rows, self._columns):
+            raise RuntimeError(f"Cannot write a {grid.get_dimensions()} grid into a {(self._rows, self._columns)} map")
+
+        rule_set = grid.get_rule_set()
+
+        # Indexed by deployment, with the last entry for the -1 of a cell that has not collapsed
+        codes = [
+            _encode(self._tile_indices[rule_set.tile_ids[tile_index]], deployment.rotation)
+            for deployment, tile_index in zip(rule_set.deployments, rule_set.deployment_tiles)
+        ]
+        codes.append(_no_tile)
+
+        self._write_cells(0, array("H", map(codes.__getitem__, grid.get_deployment_indices())))
+
+    def _write_cells(self, cell_idx: int, cells: array) -> None:
+        if sys.byteorder == "big":
+            cells.byteswap()
+
+        start = self._cells_offset + cell_idx * 2
+        self._map[start : start + len(cells) * 2] = cells.tobytes()
+
+
+def write_map_file(path: Path, grid: basic.Grid | vectorized.Grid) -> None:
+    """Write a grid to a map file, with a tile ID table taken from the grid's rules."""
+
+    with MapFileWriter(path, grid.get_dimensions(), grid.get_rule_set().tile_ids) as writer:
+        writer.write_grid(grid)
+
+
+class MapFile:
+    """
+    A map file written by `MapFileWriter`, opened through a read-only memory map.
+
+    Only the parts of the file that are read are ever loaded, so single tiles and regions of a huge map are cheap to read.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._file = path.open("rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self._rows, self._columns, table_length, self._cells_offset = _header.unpack_from(self._map)
+
+        if magic != _magic or version != _format_version:
+            self.close()
+            raise RuntimeError(f"{path} is not a version {_format_version} map file")
+
+        self._tile_ids: list[TileID] = json.loads(self._map[_header.size : _header.size + table_length])
+        self._cells = np.frombuffer(self._map, dtype="<u2", count=self._rows * self._columns, offset=self._cells_offset).reshape(
+            self._rows, self._columns
+        )
+
+    def __enter__(self) -> "MapFile":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # The array must let go of the memory map before it can be closed
+        self._cells = None
+
+        if not self._map.closed:
+            self._map.close()
+            self._file.close()
+
+    def get_dimensions(self) -> GridDimensions:
+        return (self._rows, self._columns)
+
+    def get_tile_ids(self) -> list[TileID]:
+        return self._tile_ids
+
+    def get_cells(self) -> np.ndarray:
+        """Return the raw (rows, columns) uint16 cells, backed by the memory map rather than copied."""
+
+        return self._cells
+
+    def get_tile(self, coordinate: Coordinate) -> TileDeployment | None:
+        return self._decode(int(self._cells[coordinate]))
+
+    def read_region(self, origin: Coordinate, dimensions: GridDimensions) -> ChunkTiles:
+        """Return the tiles of the block of the map with its top-left cell at `origin`."""
+
+        row, column = origin
+        block = self._cells[row : row + dimensions[0], column : column + dimensions[1]]
+
+        return [[self._decode(value) for value in block_row] for block_row in block.tolist()]
+
+    def _decode(self, value: int) -> TileDeployment | None:
+        if value == _no_tile:
+            return None
+
+        return TileDeployment(self._tile_ids[value >> 2], Rotation((value & 3) * 90))
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from wfc import basic, vectorized
+from wfc.ruleset import AdjacencyTable, RuleSet, TileDeployment
+from helpers.direction import Direction, PlanarDirections
+
+
+@dataclass
+class OverlappingModel:
+    """
+    Rules learnt from a sample image: every distinct NxN block of pixels in the sample is a pattern,
+    and two patterns may be neighbours wherever they overlap without disagreeing about any pixel.
+
+    Each pattern is a deployment of the rule set (with the pattern's index as its tile ID), weighted by how often it appears,
+    so the rules can be given to any grid. Each cell of a collapsed grid stands for the top-left pixel of its pattern.
+    """
+
+    rule_set: RuleSet
+
+    patterns: np.ndarray
+    """The (patterns, N, N) colour indices of each pattern."""
+
+    colours: np.ndarray
+    """The (colours, channels) pixel value of each colour index."""
+
+    def get_pattern_size(self) -> int:
+        return self.patterns.shape[1]
+
+    def to_image(self, grid: basic.Grid | vectorized.Grid, periodic: bool = False) -> np.ndarray:
+        """
+        Return the image produced by a 2D grid, as a (height, width, channels) array, with zeros for any cell that has not collapsed.
+
+        Pass `periodic=True` for a `basic.Grid` that wraps around (a `vectorized.Grid` never does), which produces one pixel per cell.
+        Otherwise the patterns along the bottom and right edges are drawn in full,
+        so the image is N - 1 pixels taller and wider than the grid.
+        """
+
+        rows, columns = grid.get_dimensions()
+        indices = np.frombuffer(grid.get_deployment_indices(), dtype=np.int32).reshape(rows, columns)
+        collapsed = indices >= 0
+
+        if periodic:
+            pixels = self.patterns[indices, 0, 0]
+            drawn = collapsed
+        else:
+            n = self.get_pattern_size()
+            pixels = np.empty((rows + n - 1, columns + n - 1), dtype=self.patterns.dtype)
+            drawn = np.empty(pixels.shape, dtype=bool)
+
+            # Each pixel comes from the cell that it is the top-left pixel of, or from the nearest cell on the bottom or right edge
+            pixels[:rows, :columns] = self.patterns[indices, 0, 0]
+            pixels[rows:, :columns] = self.patterns[indices[-1], 1:, 0].T
+            pixels[:rows, columns:] = self.patterns[indices[:, -1], 0, 1:]
+            pixels[rows:, columns:] = self.patterns[indices[-1, -1], 1:, 1:]
+
+            drawn[:rows, :columns] = collapsed
+            drawn[rows:, :columns] = collapsed[-1]
+            drawn[:rows, columns:] = collapsed[:, -1:]
+            drawn[rows:, columns:] = collapsed[-1, -1]
+
+        image = self.colours[pixels]
+        image[~drawn] = 0
+
+        return image
+
+
+def extract_overlapping_model(
+    sample: np.ndarray,
+    pattern_size: int = 3,
+    rotations: bool = False,
+    reflections: bool = False,
+    periodic_sample: bool = False,
+) -> OverlappingModel:
+    """
+    Learn overlapping-model rules from a sample image, given as a (height, width) or (height, width, channels) array.
+
+    Every `pattern_size` square block of the sample is a pattern, optionally along with its rotations and reflections.
+    A periodic sample wraps around, so that blocks may cross its edges.
+    """
+
+    if sample.ndim == 2:
+        sample = sample[:, :, np.newaxis]
+
+    height, width, channels = sample.shape
+    n = pattern_size
+
+    if not periodic_sample and (height < n or width < n):
+        raise RuntimeError(f"A {width}x{height} sample has no {n}x{n} patterns")
+
+    colours, colour_indices = _index_colours(sample)
+
+    if periodic_sample:
+        colour_indices = np.pad(colour_indices, ((0, n - 1), (0, n - 1)), mode="wrap")
+
+    # Most windows of a sample repeat, so count each distinct one before working out its rotations and reflections
+    windows = sliding_window_view(colour_indices, (n, n)).reshape(-1, n, n)
+    patterns, counts = _unique_patterns(windows, np.ones(len(windows)), len(colours))
+
+    variants = [patterns]
+    if rotations:
+        variants += [np.rot90(patterns, k, axes=(1, 2)) for k in (1, 2, 3)]
+    if reflections:
+        variants += [variant[:, :, ::-1] for variant in variants]
+
+    if len(variants) > 1:
+        patterns, counts = _unique_patterns(np.concatenate(variants), np.tile(counts, len(variants)), len(colours))
+
+    rule_set = RuleSet(
+        tile_ids=list(range(len(patterns))),
+        deployments=[TileDeployment(index) for index in range(len(patterns))],
+        deployment_tiles=list(range(len(patterns))),
+        deployment_weights=counts.tolist(),
+        adjacency=_overlap_adjacency(patterns, len(colours)),
+    )
+
+    return OverlappingModel(rule_set, patterns, colours)
+
+
+def _index_colours(sample: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the distinct colours of a (height, width, channels) sample, and the sample with each pixel replaced by its colour's index."""
+
+    height, width, channels = sample.shape
+
+    # 8-bit pixels pack into a single integer each, which is far quicker to sort than rows of channels
+    if sample.dtype == np.uint8 and channels <= 4:
+        packed = np.zeros((height, width), dtype=np.uint32)
+        for channel in range(channels):
+            packed |= sample[:, :, channel].astype(np.uint32) << (8 * channel)
+
+        packed_colours, colour_indices = np.unique(packed.ravel(), return_inverse=True)
+        colours = np.stack([(packed_colours >> (8 * channel)).astype(np.uint8) for channel in range(channels)], axis=1)
+    else:
+        colours, colour_indices = np.unique(sample.reshape(-1, channels), axis=0, return_inverse=True)
+
+    index_type = np.uint8 if len(colours) <= 2**8 else np.uint16 if len(colours) <= 2**16 else np.uint32
+    return (colours, colour_indices.reshape(height, width).astype(index_type))
+
+
+def _unique_patterns(patterns: np.ndarray, weights: np.ndarray, colour_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the distinct patterns, and the total weight of each."""
+
+    _, first_index, inverse = np.unique(_pattern_keys(patterns, colour_count), return_index=True, return_inverse=True)
+
+    return (patterns[first_index], np.bincount(inverse.ravel(), weights=weights))
+
+
+def _pattern_keys(patterns: np.ndarray, colour_count: int) -> np.ndarray:
+    """
+    Return a key for each pattern, such that two patterns have the same key exactly when they have the same pixels:
+    the pattern's colour indices as the digits of a single integer where they fit, or else the pattern's raw bytes.
+    """
+
+    flat = patterns.reshape(len(patterns), -1)
+
+    if colour_count ** flat.shape[1] < 2**63:
+        key = np.zeros(len(flat), dtype=np.int64)
+        for column in range(flat.shape[1]):
+            key = key * colour_count + flat[:, column]
+
+        return key
+
+    return np.ascontiguousarray(flat).view(np.dtype((np.void, flat.shape[1] * flat.itemsize))).ravel()
+
+
+def _overlap_adjacency(patterns: np.ndarray, colour_count: int) -> AdjacencyTable:
+    """
+    Work out which patterns may sit next to each other: pattern J may be placed to the right of pattern I
+    if all but the first column of I matches all but the last column of J, and likewise for the other directions.
+    """
+
+    # For each direction: the part of each pattern that a neighbour in that direction overlaps,
+    # and the part of that neighbour which overlaps it
+    overlaps = {
+        Direction.RIGHT: (patterns[:, :, 1:], patterns[:, :, :-1]),
+        Direction.LEFT: (patterns[:, :, :-1], patterns[:, :, 1:]),
+        Direction.DOWN: (patterns[:, 1:, :], patterns[:, :-1, :]),
+        Direction.UP: (patterns[:, :-1, :], patterns[:, 1:, :]),
+    }
+
+    adjacency: AdjacencyTable = {}
+
+    for direction in PlanarDirections:
+        own_parts, neighbour_parts = overlaps[direction]
+
+        # Number the distinct overlap regions, so that patterns can be grouped by the region they present
+        _, region_ids = np.unique(
+            np.concatenate([_pattern_keys(own_parts, colour_count), _pattern_keys(neighbour_parts, colour_count)]), return_inverse=True
+        )
+        own_regions, neighbour_regions = np.split(region_ids.ravel(), 2)
+
+        # Region --> every pattern whose overlap with a neighbour in the opposite direction is that region
+        masks = [0] * (int(region_ids.max()) + 1)
+        for index, region in enumerate(neighbour_regions.tolist()):
+            masks[region] |= 1 << index
+
+        adjacency[direction] = [masks[region] for region in own_regions.tolist()]
+
+    return adjacency
+
+
+def load_sample_image(image_file: Path) -> np.ndarray:
+    """Read an image file into a (height, width, channels) array, with pygame (which is only needed for this)."""
+
+    import pygame
+
+    surface = pygame.image.load(str(image_file))
+    return np.ascontiguousarray(pygame.surfarray.array3d(surface).transpose(1, 0, 2))
@@ -0,0 +1,218 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import os
+from wfc.basic import BacktrackingPolicy, Coordinate, GridDimensions
+from wfc.chunked import ChunkConstraints, ChunkTiles, compatible_deployments, solve_chunk
+from wfc.ruleset import RuleSet, TileDeployment, compile_rule_set
+from wfc.tile import TileDefinition
+from helpers.direction import Direction
+
+_unsolved = -2
+_contradiction = -1
+"""Values held in the shared map for cells that are not (yet) deployment indices."""
+
+
+_direction_offsets: dict[Direction, tuple[int, int]] = {
+    Direction.LEFT: (0, -1),
+    Direction.UP: (-1, 0),
+    Direction.DOWN: (1, 0),
+    Direction.RIGHT: (0, 1),
+}
+"""The (row, column) offset from a cell to its neighbour in each direction."""
+
+
+@dataclass(frozen=True)
+class _Block:
+    """A rectangle of the map for one worker to solve, as top, bottom, left, right (with exclusive ends)."""
+
+    top: int
+    bottom: int
+    left: int
+    right: int
+    seed: str
+
+
+@dataclass(frozen=True)
+class _WorkerState:
+    rule_set: RuleSet
+    dimensions: GridDimensions
+    max_attempts: int
+    backtracking: BacktrackingPolicy | None
+    shared_map_name: str
+
+
+_worker_state: _WorkerState | None = None
+_worker_shared_map: shared_memory.SharedMemory | None = None
+"""The state of the process that solves blocks, set once by `_start_worker` when it starts."""
+
+
+def _partition(length: int, region_length: int, seam_length: int) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    """Split one axis into regions separated by seams, returning the (start, end) of each region and of each seam."""
+
+    regions, seams = ([], [])
+
+    for start in range(0, length, region_length + seam_length):
+        regions.append((start, min(start + region_length, length)))
+
+        if start + region_length < length:
+            seams.append((start + region_length, min(start + region_length + seam_length, length)))
+
+    return (regions, seams)
+
+
+def _start_worker(state: _WorkerState) -> None:
+    global _worker_state, _worker_shared_map
+
+    _worker_state = state
+    _worker_shared_map = shared_memory.SharedMemory(name=state.shared_map_name)
+
+
+def _stop_worker() -> None:
+    global _worker_state, _worker_shared_map
+
+    if _worker_shared_map is not None:
+        _worker_shared_map.close()
+
+    _worker_state, _worker_shared_map = (None, None)
+
+
+def _solve_block(block: _Block) -> bool:
+    """
+    Solve one block of the shared map, with every cell around it that has already been solved fixed in place,
+    and write the block back into the shared map. Returns whether the block was free of contradictions.
+    """
+
+    assert _worker_state is not None and _worker_shared_map is not None
+
+    rule_set = _worker_state.rule_set
+    rows, columns = _worker_state.dimensions
+    shared_map = _worker_shared_map.buf.cast("i")
+
+    # Solve the block inside a grid with a ring of one cell around it, clipped to the edges of the map
+    top, bottom = (max(block.top - 1, 0), min(block.bottom + 1, rows))
+    left, right = (max(block.left - 1, 0), min(block.right + 1, columns))
+
+    ring: dict[Coordinate, TileDeployment] = {}
+    for row in range(top, bottom):
+        for column in range(left, right):
+            index = shared_map[row * columns + column]
+
+            if not (block.top <= row < block.bottom and block.left <= column < block.right) and index >= 0:
+                ring[(row - top, column - left)] = rule_set.deployments[index]
+
+    constraints: ChunkConstraints = [(coordinate, [tile]) for coordinate, tile in ring.items()]
+    tiles, valid = solve_chunk(
+        rule_set, (bottom - top, right - left), constraints, block.seed, _worker_state.max_attempts, _worker_state.backtracking
+    )
+
+    deployment_indices = {deployment: i for i, deployment in enumerate(rule_set.deployments)}
+
+    for row in range(block.top, block.bottom):
+        for column in range(block.left, block.right):
+            tile = tiles[row - top][column - left]
+
+            # Where a fixed neighbour was lost to a contradiction, the cells next to it were never checked against it
+            if tile is not None and not valid:
+                for direction, (row_offset, column_offset) in _direction_offsets.items():
+                    # The neighbour that this tile is in `direction` of
+                    neighbour = ring.get((row - top - row_offset, column - left - column_offset))
+
+                    if neighbour is not None and tile not in compatible_deployments(rule_set, neighbour, direction):
+                        tile = None
+
+            shared_map[row * columns + column] = deployment_indices[tile] if tile is not None else _contradiction
+
+    shared_map.release()
+    return valid
+
+
+class ParallelSolver:
+    """
+    Collapses a large grid across several processes.
+
+    The grid is split into regions separated by seams a few cells wide. The regions never touch each other,
+    so they are all solved at once, then the seams between regions in the same row of regions, and finally the seams
+    that run the full height of the grid, each with the cells already solved around them fixed in place.
+
+    The map is held in shared memory as one deployment index per cell, which the workers read their borders from and
+    write their blocks into, so no grid state is ever pickled. Each block is seeded from its position alone, so the
+    result does not depend on the number of workers.
+    """
+
+    def __init__(
+        self,
+        tile_definitions: list[TileDefinition] | RuleSet,
+        dimensions: GridDimensions,
+        seed: int,
+        region_dimensions: GridDimensions = (128, 128),
+        seam_width: int = 4,
+        workers: int | None = None,
+        max_attempts: int = 3,
+        backtracking: BacktrackingPolicy | None = BacktrackingPolicy(),
+    ) -> None:
+        self._rule_set: RuleSet = tile_definitions if isinstance(tile_definitions, RuleSet) else compile_rule_set(tile_definitions)
+        self._dimensions = dimensions
+        self._seed = seed
+        self._region_dimensions = region_dimensions
+        self._seam_width = seam_width
+        self._workers = workers if workers is not None else os.cpu_count() or 1
+        self._max_attempts = max_attempts
+        self._backtracking = backtracking
+
+    def solve(self) -> tuple[ChunkTiles, int]:
+        """Collapse the whole grid. Returns its tiles, and how many blocks were left with contradictions."""
+
+        rows, columns = self._dimensions
+        row_regions, row_seams = _partition(rows, self._region_dimensions[0], self._seam_width)
+        column_regions, column_seams = _partition(columns, self._region_dimensions[1], self._seam_width)
+
+        phases = [
+            [
+                _Block(*row_span, *column_span, f"{self._seed}/region/{row_span[0]}/{column_span[0]}")
+                for row_span in row_regions
+                for column_span in column_regions
+            ],
+            [
+                _Block(*row_span, *column_span, f"{self._seed}/row_seam/{row_span[0]}/{column_span[0]}")
+                for row_span in row_seams
+                for column_span in column_regions
+            ],
+            [_Block(0, rows, *column_span, f"{self._seed}/column_seam/{column_span[0]}") for column_span in column_seams],
+        ]
+
+        shared_map = shared_memory.SharedMemory(create=True, size=rows * columns * 4)
+
+        try:
+            cells = shared_map.buf.cast("i")
+            cells[:] = array("i", [_unsolved]) * (rows * columns)
+            cells.release()
+
+            state = _WorkerState(self._rule_set, self._dimensions, self._max_attempts, self._backtracking, shared_map.name)
+            failed_blocks = self._run_phases(phases, state)
+
+            cells = shared_map.buf.cast("i")
+            deployments = self._rule_set.deployments
+            tiles = [
+                [deployments[index] if index >= 0 else None for index in cells[row * columns : (row + 1) * columns]] for row in range(rows)
+            ]
+            cells.release()
+        finally:
+            shared_map.close()
+            shared_map.unlink()
+
+        return (tiles, failed_blocks)
+
+    def _run_phases(self, phases: list[list[_Block]], state: _WorkerState) -> int:
+        if self._workers == 1:
+            _start_worker(state)
+
+            try:
+                return sum(not _solve_block(block) for phase in phases for block in phase)
+            finally:
+                _stop_worker()
+
+        with ProcessPoolExecutor(max_workers=self._workers, initializer=_start_worker, initargs=(state,)) as executor:
+            # Every block in a phase is separated from the others by cells that are solved in a later phase
+            return sum(sum(not valid for valid in executor.map(_solve_block, phase)) for phase in phases)
@@ -0,0 +1,194 @@
+from dataclasses import dataclass
+from wfc.abstract_socket import SocketSet
+from wfc.tile import TileDefinition, TileID, DirectionalSocketSetMap, rotate_socket_sets
+from helpers.direction import Direction, opposite_direction
+from helpers.rotation import Rotation
+
+AdjacencyTable = dict[Direction, list[int]]
+"""
+Maps a direction D and a deployment index I to a bitmask of the deployment indices that may be placed in direction D of I.
+
+Bit J of `table[D][I]` is set if deployment J is compatible with deployment I when J is placed in direction D of I.
+There is an entry for every direction that the tiles have sockets for: the four planar directions, plus `ABOVE` and `BELOW`
+for tiles that can be stacked in a 3D grid.
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class TileDeployment:
+    """Describes a tile in a specific position."""
+
+    id: TileID
+    rotation: Rotation = Rotation.NONE
+
+
+@dataclass
+class RuleSet:
+    """
+    A list of tile definitions, compiled into the form that the grids work with.
+
+    Every allowed rotation of every tile becomes a deployment, identified by its index in `deployments`.
+    Sockets are only compared while compiling; grids only ever look up the compiled adjacency table.
+    """
+
+    tile_ids: list[TileID]
+    """The tile IDs, in the order of the tile definitions they were compiled from."""
+
+    deployments: list[TileDeployment]
+
+    deployment_tiles: list[int]
+    """The index (into `tile_ids`) of the tile that each deployment is a rotation of."""
+
+    deployment_weights: list[float]
+    """The probability weight of each deployment: its tile's weight, shared evenly between the tile's rotations."""
+
+    adjacency: AdjacencyTable
+
+
+def compile_rule_set(tile_definitions: list[TileDefinition]) -> RuleSet:
+    """
+    Expand each tile definition into its deployments, and work out which deployments may sit next to each other.
+
+    Every tile must have a `prob_weight` above zero: a cell left with only weightless deployments could not be sampled,
+    and would have no defined entropy.
+    """
+
+    deployments: list[TileDeployment] = []
+    deployment_tiles: list[int] = []
+    deployment_weights: list[float] = []
+    deployment_socket_sets: list[DirectionalSocketSetMap] = []
+
+    for tile_idx, tile_def in enumerate(tile_definitions):
+        if not tile_def.prob_weight > 0:
+            raise RuntimeError(
+                f"Tile {tile_def.id} has a prob_weight of {tile_def.prob_weight}, but every tile must have a weight above zero"
+            )
+
+        for rotation in tile_def.allowed_rotations:
+            deployments.append(TileDeployment(tile_def.id, rotation=rotation))
+            deployment_tiles.append(tile_idx)
+            deployment_weights.append(tile_def.prob_weight / len(tile_def.allowed_rotations))
+            deployment_socket_sets.append(rotate_socket_sets(tile_def.socket_sets, rotation))
+
+    return RuleSet(
+        tile_ids=[tile_def.id for tile_def in tile_definitions],
+        deployments=deployments,
+        deployment_tiles=deployment_tiles,
+        deployment_weights=deployment_weights,
+        adjacency=compile_adjacency_table(deployment_socket_sets),
+    )
+
+
+def compile_adjacency_table(deployment_socket_sets: list[DirectionalSocketSetMap]) -> AdjacencyTable:
+    """Work out, once, which deployments may sit next to each other in each direction."""
+
+    # Only the directions that every tile has sockets for, so tiles that also have sockets above and below
+    # can be mixed with (and then behave like) tiles that only have the four planar directions
+    directions = [direction for direction in Direction if all(direction in socket_sets for socket_sets in deployment_socket_sets)]
+
+    adjacency: AdjacencyTable = {direction: [0] * len(deployment_socket_sets) for direction in directions}
+
+    for direction in directions:
+        for index, socket_sets in enumerate(deployment_socket_sets):
+            socket_set = socket_sets[direction]
+
+            for other_index, other_socket_sets in enumerate(deployment_socket_sets):
+                if socket_sets_are_compatible(other_socket_sets[opposite_direction[direction]], socket_set):
+                    adjacency[direction][index] |= 1 << other_index
+
+    return adjacency
+
+
+def socket_sets_are_compatible(first: SocketSet, second: SocketSet) -> bool:
+    for fs in first:
+        for ss in second:
+            if fs.compatible_with(ss):
+                return True
+
+    return False
+
+
+@dataclass(frozen=True)
+class OptimisationReport:
+    """How much `optimise_rule_set` shrank a rule set."""
+
+    deployments_before: int
+    deployments_after: int
+
+    merged: int
+    """Deployments that were merged into another rotation of the same tile that behaves identically."""
+
+    pruned: int
+    """Deployments that were removed because they could never have a neighbour in some direction."""
+
+
+def optimise_rule_set(rule_set: RuleSet) -> tuple[RuleSet, OptimisationReport]:
+    """
+    Shrink a rule set without changing which maps it can produce away from the edges of a grid.
+
+    Deployments that have no compatible deployment in some direction are removed (repeatedly, since removing one can leave
+    another without partners). They can only ever be placed against the edge of a grid, so pruning them does stop them
+    appearing there.
+
+    Rotations of the same tile that are compatible with exactly the same deployments in every direction
+    (such as the rotations of a symmetric tile) are merged into the first of them, which takes their combined weight.
+    """
+
+    deployment_count = len(rule_set.deployments)
+
+    alive = (1 << deployment_count) - 1
+    while True:
+        dead = 0
+        for index in range(deployment_count):
+            if (alive >> index) & 1 and any(masks[index] & alive == 0 for masks in rule_set.adjacency.values()):
+                dead |= 1 << index
+
+        if dead == 0:
+            break
+
+        alive &= ~dead
+
+    if alive == 0:
+        raise RuntimeError("Every tile deployment is missing a compatible neighbour in some direction")
+
+    # (tile, compatible deployments in each direction) --> the index of the first deployment found with them
+    representatives: dict[tuple[int, ...], int] = {}
+    merged_into: dict[int, int] = {}
+
+    for index in range(deployment_count):
+        if (alive >> index) & 1:
+            key = (rule_set.deployment_tiles[index], *(masks[index] & alive for masks in rule_set.adjacency.values()))
+            merged_into[index] = representatives.setdefault(key, index)
+
+    kept = sorted(representatives.values())
+    new_indices = {old_index: new_index for new_index, old_index in enumerate(kept)}
+
+    weights = [0.0] * len(kept)
+    for index, representative in merged_into.items():
+        weights[new_indices[representative]] += rule_set.deployment_weights[index]
+
+    adjacency: AdjacencyTable = {direction: [0] * len(kept) for direction in rule_set.adjacency}
+    for direction in rule_set.adjacency:
+        for new_index, old_index in enumerate(kept):
+            allowed = rule_set.adjacency[direction][old_index] & alive
+
+            for other_index in range(deployment_count):
+                if (allowed >> other_index) & 1:
+                    adjacency[direction][new_index] |= 1 << new_indices[merged_into[other_index]]
+
+    optimised = RuleSet(
+        tile_ids=rule_set.tile_ids,
+        deployments=[rule_set.deployments[index] for index in kept],
+        deployment_tiles=[rule_set.deployment_tiles[index] for index in kept],
+        deployment_weights=weights,
+        adjacency=adjacency,
+    )
+
+    report = OptimisationReport(
+        deployments_before=deployment_count,
+        deployments_after=len(kept),
+        merged=len(merged_into) - len(kept),
+        pruned=deployment_count - len(merged_into),
+    )
+
+    return (optimised, report)
@@ -32,7 +32,9 @@ def rotate_socket_sets(socket_sets: DirectionalSocketSetMap, rotation: Rotation)
 
 
 def _rotate_socket_sets_clockwise(socket_sets: DirectionalSocketSetMap) -> DirectionalSocketSetMap:
+    # Tiles only rotate within their layer, so any sockets above and below stay where they are
     rotated_socket_sets: DirectionalSocketSetMap = {
+        **socket_sets,
         Direction.UP: socket_sets[move_anticlockwise[Direction.UP]],
         Direction.RIGHT: socket_sets[move_anticlockwise[Direction.RIGHT]],
         Direction.DOWN: socket_sets[move_anticlockwise[Direction.DOWN]],
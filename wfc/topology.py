@@ -0,0 +1,125 @@
+from array import array
+from functools import lru_cache
+from helpers.direction import Direction
+
+Dimensions = tuple[int, ...]
+"""The length of each axis of a grid: (columns,), (rows, columns) or (layers, rows, columns)."""
+
+CellCoordinate = tuple[int, ...]
+"""The position of a cell, with one entry per axis in the same order as its grid's `Dimensions`."""
+
+NeighbourTables = tuple[tuple[Direction, array], ...]
+"""For each direction, the index of every cell's neighbour in that direction, or -1 where it has none."""
+
+
+_axis_directions: list[tuple[Direction, Direction]] = [
+    (Direction.LEFT, Direction.RIGHT),
+    (Direction.UP, Direction.DOWN),
+    (Direction.BELOW, Direction.ABOVE),
+]
+"""
+The (towards lower coordinates, towards higher coordinates) directions along the last axis of a grid, the second last,
+and the third last. Layer 0 of a 3D grid is the bottom layer, and row 0 of a layer is its top row.
+"""
+
+
+class GridTopology:
+    """
+    The shape of a grid with one, two or three axes, and which of its cells are next to each other.
+
+    Cells are numbered in row-major order, so that the last coordinate varies fastest.
+    Along a periodic axis the grid wraps around, so that the cells at either end of the axis are neighbours.
+
+    The neighbours are worked out once, as a flat array per direction, so finding a neighbour is a single lookup.
+    Grids with the same shape share the same arrays.
+    """
+
+    def __init__(self, dimensions: Dimensions, periodic: bool | tuple[bool, ...] = False) -> None:
+        if not 1 <= len(dimensions) <= len(_axis_directions):
+            raise RuntimeError(f"Grids must have between 1 and {len(_axis_directions)} axes, not {len(dimensions)}")
+
+        if any(length < 1 for length in dimensions):
+            raise RuntimeError(f"Every axis of a grid needs at least one cell: {dimensions}")
+
+        self.dimensions: Dimensions = tuple(dimensions)
+        self.periodic: tuple[bool, ...] = periodic if isinstance(periodic, tuple) else (periodic,) * len(dimensions)
+
+        if len(self.periodic) != len(self.dimensions):
+            raise RuntimeError(f"Expected one periodic flag per axis of {self.dimensions}, not {self.periodic}")
+
+        self.cell_count = 1
+        self._strides: list[int] = []
+
+        for length in reversed(self.dimensions):
+            self._strides.insert(0, self.cell_count)
+            self.cell_count *= length
+
+        self.neighbours: NeighbourTables = _build_neighbour_tables(self.dimensions, self.periodic)
+
+        self.directions: list[Direction] = [direction for (direction, _) in self.neighbours]
+
+    def contains(self, coordinate: CellCoordinate) -> bool:
+        return len(coordinate) == len(self.dimensions) and all(0 <= value < length for value, length in zip(coordinate, self.dimensions))
+
+    def index(self, coordinate: CellCoordinate) -> int:
+        if len(self.dimensions) == 2:
+            return coordinate[0] * self.dimensions[1] + coordinate[1]
+
+        return sum(value * stride for value, stride in zip(coordinate, self._strides))
+
+    def coordinate(self, cell_idx: int) -> CellCoordinate:
+        if len(self.dimensions) == 2:
+            return divmod(cell_idx, self.dimensions[1])
+
+        coordinate: list[int] = []
+        for length in reversed(self.dimensions):
+            cell_idx, value = divmod(cell_idx, length)
+            coordinate.append(value)
+
+        return tuple(reversed(coordinate))
+
+    def nest(self, values: list) -> list:
+        """Split a flat, row-major list with one value per cell into nested lists, one level per axis."""
+
+        for length in reversed(self.dimensions[1:]):
+            values = [values[start : start + length] for start in range(0, len(values), length)]
+
+        return values
+
+
+@lru_cache(maxsize=32)
+def _build_neighbour_tables(dimensions: Dimensions, periodic: tuple[bool, ...]) -> NeighbourTables:
+    cell_count = 1
+    for length in dimensions:
+        cell_count *= length
+
+    tables: dict[Direction, array] = {}
+    stride = 1
+
+    for axis in reversed(range(len(dimensions))):
+        length = dimensions[axis]
+        lower_direction, higher_direction = _axis_directions[len(dimensions) - 1 - axis]
+
+        tables[lower_direction] = _build_neighbour_table(cell_count, stride, length, -1, periodic[axis])
+        tables[higher_direction] = _build_neighbour_table(cell_count, stride, length, 1, periodic[axis])
+
+        stride *= length
+
+    # In the order of the `Direction` enum, so that a 2D grid visits neighbours in the same order whatever its shape
+    return tuple((direction, tables[direction]) for direction in Direction if direction in tables)
+
+
+def _build_neighbour_table(cell_count: int, stride: int, length: int, step: int, periodic: bool) -> array:
+    """Return the neighbour of every cell one step (-1 or 1) along the axis whose cells are `stride` apart."""
+
+    table = array("i", range(step * stride, cell_count + step * stride))
+
+    # The cells at the end of the axis that the step moves towards, which are in runs of `stride` cells
+    first_edge = 0 if step < 0 else (length - 1) * stride
+    wrap_offset = -step * (length - 1) * stride
+    missing = array("i", [-1]) * stride
+
+    for start in range(first_edge, cell_count, stride * length):
+        table[start : start + stride] = array("i", range(start + wrap_offset, start + wrap_offset + stride)) if periodic else missing
+
+    return table